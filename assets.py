@@ -0,0 +1,165 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+from io import BytesIO
+
+from flask import current_app, request, send_from_directory, url_for as flask_url_for
+from PIL import Image
+
+try:
+    import brotli
+except ImportError:  # .br siblings are only written when brotli is installed
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+BUILD_DIR = 'dist'  # relative to STATIC_DIR
+MANIFEST_PATH = os.path.join(STATIC_DIR, BUILD_DIR, 'manifest.json')
+
+# Logical paths (relative to static/) that get fingerprinted copies
+BUILD_SOURCES = ('css', 'js', 'assets')
+MIMETYPES = {'.css': 'text/css', '.js': 'text/javascript', '.svg': 'image/svg+xml',
+             '.json': 'application/json', '.txt': 'text/plain'}
+COMPRESSIBLE = set(MIMETYPES)
+# Full-width masthead backgrounds also get narrower renditions for small screens
+BACKGROUND_WIDTHS = (768, 1280, 1920)
+FAR_FUTURE = 31536000
+
+_manifest = None
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def _hashed_name(logical_path, data, suffix=''):
+    stem, ext = os.path.splitext(logical_path)
+    return f"{stem}{suffix}.{_digest(data)}{ext}"
+
+
+def _write(rel_path, data):
+    path = os.path.join(STATIC_DIR, BUILD_DIR, rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    if os.path.splitext(rel_path)[1] in COMPRESSIBLE:
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(path + '.br', 'wb') as f:
+                f.write(brotli.compress(data, quality=11))
+
+
+def _encode(image, fmt, **options):
+    buf = BytesIO()
+    image.save(buf, fmt, **options)
+    return buf.getvalue()
+
+
+def _build_background(logical_path, source_path, manifest):
+    """Write resized JPEG renditions with WebP siblings of a background image"""
+    with Image.open(source_path) as original:
+        original = original.convert('RGB')
+        for width in BACKGROUND_WIDTHS:
+            image = original
+            if original.width > width:
+                image = original.resize((width, round(original.height * width / original.width)), Image.LANCZOS)
+            jpeg = _encode(image, 'JPEG', quality=80, optimize=True, progressive=True)
+            hashed = _hashed_name(logical_path, jpeg, f".{width}")
+            _write(hashed, jpeg)
+            # Served instead of the JPEG to browsers that accept WebP
+            _write(os.path.splitext(hashed)[0] + '.webp', _encode(image, 'WEBP', quality=78, method=6))
+            manifest[f"{logical_path}@{width}"] = hashed
+
+
+def build():
+    """Fingerprint, precompress and resize static assets into static/dist; returns the manifest"""
+    shutil.rmtree(os.path.join(STATIC_DIR, BUILD_DIR), ignore_errors=True)
+    manifest = {}
+    for source in BUILD_SOURCES:
+        for root, _, files in os.walk(os.path.join(STATIC_DIR, source)):
+            for name in sorted(files):
+                source_path = os.path.join(root, name)
+                logical_path = os.path.relpath(source_path, STATIC_DIR).replace(os.sep, '/')
+                with open(source_path, 'rb') as f:
+                    data = f.read()
+                hashed = _hashed_name(logical_path, data)
+                _write(hashed, data)
+                manifest[logical_path] = hashed
+                if name.endswith(('-bg.jpg', '_bg.jpg')):
+                    _build_background(logical_path, source_path, manifest)
+
+    with open(MANIFEST_PATH, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    global _manifest
+    _manifest = manifest
+    return manifest
+
+
+def load_manifest():
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(MANIFEST_PATH) as f:
+                _manifest = json.load(f)
+        except (OSError, ValueError):
+            _manifest = {}
+    return _manifest
+
+
+def static_path(filename, width=None):
+    """Fingerprinted path for a static file when a build exists, otherwise the file itself"""
+    manifest = load_manifest()
+    if width is not None and f"{filename}@{width}" in manifest:
+        return f"{BUILD_DIR}/{manifest[f'{filename}@{width}']}"
+    if filename in manifest:
+        return f"{BUILD_DIR}/{manifest[filename]}"
+    return filename
+
+
+def url_for(endpoint, **values):
+    """Drop-in for flask.url_for that rewrites static filenames to their fingerprinted copies"""
+    if endpoint == 'static' and 'filename' in values:
+        values['filename'] = static_path(values['filename'])
+    return flask_url_for(endpoint, **values)
+
+
+def masthead_style(filename):
+    """Inline style for a masthead background, with a small-screen rendition when one was built"""
+    large = flask_url_for('static', filename=static_path(filename, BACKGROUND_WIDTHS[-1]))
+    small = flask_url_for('static', filename=static_path(filename, BACKGROUND_WIDTHS[0]))
+    if small == large:
+        return f"background-image: url('{large}')"
+    return f"background-image: url('{large}'); --masthead-sm: url('{small}')"
+
+
+def send_static(filename):
+    """Static view: fingerprinted files are immutable and served precompressed or as WebP when accepted"""
+    if not filename.startswith(BUILD_DIR + '/'):
+        return current_app.send_static_file(filename)
+
+    served = filename
+    encoding = None
+    stem, ext = os.path.splitext(filename)
+    webp_path = os.path.join(STATIC_DIR, stem + '.webp')
+    has_webp = ext == '.jpg' and os.path.exists(webp_path)
+    if has_webp and 'image/webp' in request.accept_mimetypes.values():
+        served = stem + '.webp'
+    elif ext in COMPRESSIBLE:
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if request.accept_encodings[candidate] and os.path.exists(os.path.join(STATIC_DIR, filename + suffix)):
+                served, encoding = filename + suffix, candidate
+                break
+
+    response = send_from_directory(STATIC_DIR, served, max_age=FAR_FUTURE, conditional=True)
+    if encoding:
+        response.content_encoding = encoding
+        response.mimetype = MIMETYPES[ext]
+    if has_webp:
+        response.vary.add('Accept')
+    elif ext in COMPRESSIBLE:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
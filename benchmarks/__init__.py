@@ -0,0 +1 @@
+"""Performance benchmarks. Run them against a scratch database, never production."""
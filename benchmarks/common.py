@@ -0,0 +1,35 @@
+import json
+import statistics
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize(latencies_ms, elapsed_s, queries=None):
+    """Throughput and latency percentiles for one route; `queries` is per-request query counts"""
+    return {
+        "requests": len(latencies_ms),
+        "throughput_rps": round(len(latencies_ms) / elapsed_s, 1) if elapsed_s else None,
+        "p50_ms": round(statistics.median(latencies_ms), 2),
+        "p95_ms": round(percentile(latencies_ms, 95), 2),
+        "p99_ms": round(percentile(latencies_ms, 99), 2),
+        "queries_per_request": round(statistics.mean(queries), 2) if queries else None,
+    }
+
+
+def compare(results, baseline_path):
+    """Print the change of every metric against a saved run"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    for route, metrics in results["routes"].items():
+        before = baseline.get("routes", {}).get(route)
+        if not before:
+            print(f"{route}: no baseline")
+            continue
+        changes = []
+        for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "queries_per_request"):
+            if metrics.get(key) is not None and before.get(key):
+                changes.append(f"{key} {before[key]} -> {metrics[key]} ({(metrics[key] / before[key] - 1) * 100:+.1f}%)")
+        print(f"{route}: " + ", ".join(changes))
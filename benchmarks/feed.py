@@ -0,0 +1,119 @@
+"""Measure /feed latency in both feed modes for readers following 10, 1,000 and 10,000 authors.
+
+    python -m benchmarks.seed --users 10000 --posts 100000
+    python -m benchmarks.feed --requests 200 --output feed.json
+
+Reader accounts (bench-feed-<n>@example.com) are created for the run and removed afterwards.
+Followees are drawn from the seeded users, so the largest reader needs that many seeded users.
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timezone
+
+import feed
+from benchmarks.common import compare, summarize
+from benchmarks.routes import RequestStats, fetch
+from benchmarks.seed import seeded_ranges
+from database import pool
+
+FOLLOWEE_COUNTS = (10, 1000, 10000)
+MODES = ("read", "write")
+
+
+def create_readers(followee_counts, user_range, seed):
+    """One reader per followee count, following that many seeded users; returns {count: reader_id}"""
+    rng = random.Random(seed)
+    first, last = user_range
+    readers = {}
+    with pool.connection() as conn, conn.cursor() as cur:
+        for count in followee_counts:
+            cur.execute("""
+                INSERT INTO users (email, password, first_name, last_name) VALUES (%s, '!', 'Bench', 'Reader')
+                ON CONFLICT (email) DO UPDATE SET email = EXCLUDED.email
+                RETURNING id
+            """, (f"bench-feed-{count}@example.com",))
+            reader_id = cur.fetchone()[0]
+            followees = rng.sample(range(first, last + 1), min(count, last - first + 1))
+            cur.execute("""
+                INSERT INTO followers (follower_id, followed_id)
+                SELECT %s, unnest(%s::int[]) ON CONFLICT DO NOTHING
+            """, (reader_id, followees))
+            readers[count] = reader_id
+        cur.execute("ANALYZE followers")
+    return readers
+
+
+def remove_readers(readers):
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM users WHERE id = ANY(%s)", (list(readers.values()),))
+
+
+def run(readers, requests):
+    from main import app
+
+    request_stats = RequestStats(app)
+    results = {}
+    for mode in MODES:
+        feed.FEED_CONFIG['mode'] = mode
+        if mode == "write":
+            with pool.connection() as conn, conn.cursor() as cur:
+                start = time.perf_counter()
+                rows = feed.rebuild_timelines(cur, readers.values())
+                print(f"  materialized {rows} timeline rows in {time.perf_counter() - start:.1f}s")
+
+        for count, reader_id in readers.items():
+            client = app.test_client()
+            with client.session_transaction() as session:
+                session["_user_id"] = str(reader_id)
+                session["_fresh"] = True
+
+            # Alternate between the first page and the page after it, like a reader scrolling
+            with pool.connection() as conn, conn.cursor() as cur:
+                first_page, _ = feed.feed_page(cur, reader_id)
+            second_page = f"/feed?before={first_page[-1][0]}" if first_page else "/feed"
+
+            latencies, queries = [], []
+            started = time.perf_counter()
+            for i in range(requests):
+                response, elapsed = fetch(client, "/feed" if i % 2 == 0 else second_page)
+                latencies.append(elapsed)
+                queries.append(request_stats.queries or 0)
+                assert response.status_code == 200, response.status_code
+            name = f"feed_{mode}_{count}"
+            results[name] = summarize(latencies, time.perf_counter() - started, queries)
+            print(f"{name}: {results[name]}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--followees", type=int, nargs="+", default=list(FOLLOWEE_COUNTS))
+    parser.add_argument("--requests", type=int, default=200, help="requests per mode and reader")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="compare against a previous --output file")
+    args = parser.parse_args()
+
+    readers = create_readers(args.followees, seeded_ranges()["users"], args.seed)
+    try:
+        routes = run(readers, args.requests)
+    finally:
+        remove_readers(readers)
+
+    results = {
+        "mode": "test_client",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "requests_per_route": args.requests,
+        "routes": routes,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Compare the hot routes with prepared statements on and off (DB_PREPARE).
+
+    python -m benchmarks.seed
+    python -m benchmarks.prepared --requests 2000 --output prepared.json
+
+Both passes go through the Flask test client in this process and request the same paths. Besides
+latency it reports the CPU time this process spent per request (app, driver and row mapping) and the
+database time from the request's QueryStats, which is where skipped parse/plan work shows up.
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timezone
+
+from benchmarks.common import compare, summarize
+from benchmarks.routes import ROUTES, RequestStats, fetch
+from benchmarks.seed import seeded_ranges
+from statements import STATEMENT_CONFIG
+
+WARMUP = 20
+
+
+def run(routes, requests, ranges, seed):
+    from main import app
+
+    request_stats = RequestStats(app)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = str(ranges["users"][0])
+        session["_fresh"] = True
+
+    results = {}
+    for prepare in (False, True):
+        STATEMENT_CONFIG['prepare'] = prepare
+        label = "prepared" if prepare else "plain"
+        for name in routes:
+            build_path = ROUTES[name][0]
+            rng = random.Random(seed)
+            paths = [build_path(rng, ranges) for _ in range(requests)]
+            for path in paths[:WARMUP]:  # prepares the statements on the pooled connection
+                fetch(client, path)
+
+            latencies, cpu, db, queries = [], [], [], []
+            started = time.perf_counter()
+            for path in paths:
+                start_cpu = time.process_time()
+                response, elapsed = fetch(client, path)
+                cpu.append((time.process_time() - start_cpu) * 1000)
+                latencies.append(elapsed)
+                db.append(request_stats.db_ms or 0.0)
+                queries.append(request_stats.queries or 0)
+                assert response.status_code in (200, 302), (path, response.status_code)
+            metrics = summarize(latencies, time.perf_counter() - started, queries)
+            metrics["cpu_ms_per_request"] = round(statistics.mean(cpu), 3)
+            metrics["db_ms_per_request"] = round(statistics.mean(db), 3)
+            results[f"{label}:{name}"] = metrics
+            print(f"{label}:{name}: {metrics}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--routes", nargs="+", choices=sorted(ROUTES), default=["show_post", "show_post_hot",
+                                                                               "profile"])
+    parser.add_argument("--requests", type=int, default=1000, help="requests per route and pass")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="compare against a previous --output file")
+    args = parser.parse_args()
+
+    routes = run(args.routes, args.requests, seeded_ranges(), args.seed)
+
+    print(f"\n{'route':<18}{'cpu ms':>16}{'db ms':>16}{'p50 ms':>16}")
+    for name in args.routes:
+        plain, prepared = routes[f"plain:{name}"], routes[f"prepared:{name}"]
+        print(f"{name:<18}" + "".join(f"{f'{plain[key]} -> {prepared[key]}':>16}" for key in
+                                      ("cpu_ms_per_request", "db_ms_per_request", "p50_ms")))
+
+    results = {
+        "mode": "test_client",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "requests_per_route": args.requests,
+        "routes": routes,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Drive the main routes against seeded data and report throughput, latency and queries per request.
+
+    python -m benchmarks.routes --requests 500 --output run.json
+    python -m benchmarks.routes --base-url http://127.0.0.1:8000 --threads 16 --baseline run.json
+
+Without --base-url requests go through the Flask test client in this process. With --base-url
+a pool of threads drives a running server (for example `gunicorn main:app`) over HTTP. In-process
+runs count queries from each request's QueryStats once its body has been read; over HTTP they
+come from the Server-Timing header, which on streamed pages only covers the queries run before
+the body.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+from benchmarks.common import compare, summarize
+from benchmarks.seed import BENCH_PASSWORD, VOCABULARY, seeded_ranges
+
+# name -> (builds a path from (rng, ranges), needs a logged-in session)
+ROUTES = {
+    "get_all_posts": (lambda rng, r: "/", False),
+    "get_all_posts_older": (lambda rng, r: f"/?before={rng.randint(*r['posts'])}", False),
+    "show_post": (lambda rng, r: f"/post/{rng.randint(*r['posts'])}", True),
+    # comments are skewed toward the first seeded posts, so these are the heavy pages
+    "show_post_hot": (lambda rng, r: f"/post/{r['posts'][0] + rng.randint(0, 20)}", True),
+    "profile": (lambda rng, r: f"/profile/{rng.randint(*r['users'])}", True),
+    "search": (lambda rng, r: f"/search?q={rng.choice(VOCABULARY)}", False),
+    # seeded posts are ten minutes apart from 2020-01-01, so 100k posts span about two years
+    "archive": (lambda rng, r: f"/archive/{rng.choice((2020, 2021))}/{rng.randint(1, 12)}", False),
+}
+
+
+_QUERY_COUNT = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+def query_count(response_headers):
+    match = _QUERY_COUNT.search(response_headers.get("Server-Timing", ""))
+    return int(match.group(1)) if match else None
+
+
+class RequestStats:
+    """Queries and DB time of the last test-client request, read from its QueryStats at teardown.
+
+    Streamed pages run most of their queries after the headers (and Server-Timing) are built,
+    so in-process runs count them here instead. Create it before the app handles a request.
+    """
+
+    def __init__(self, app):
+        self.queries = self.db_ms = None
+        app.teardown_request(self._record)
+
+    def _record(self, exception):
+        from flask import g
+
+        stats = g.get('query_stats')
+        if stats is not None:
+            self.queries, self.db_ms = stats.count, stats.total * 1000
+
+
+def fetch(client, path):
+    """GET through the test client, reading and closing the (possibly streamed) body; returns (response, ms)"""
+    start = time.perf_counter()
+    response = client.get(path)
+    response.get_data()
+    response.close()  # ends a streamed request's context and returns its pooled connection
+    return response, (time.perf_counter() - start) * 1000
+
+
+def run_test_client(routes, requests, ranges, seed):
+    from main import app
+
+    request_stats = RequestStats(app)
+    rng = random.Random(seed)
+    anonymous = app.test_client()
+    logged_in = app.test_client()
+    with logged_in.session_transaction() as session:
+        session["_user_id"] = str(ranges["users"][0])
+        session["_fresh"] = True
+
+    results = {}
+    for name in routes:
+        build_path, needs_login = ROUTES[name]
+        client = logged_in if needs_login else anonymous
+        latencies, queries = [], []
+        started = time.perf_counter()
+        for _ in range(requests):
+            path = build_path(rng, ranges)
+            response, elapsed = fetch(client, path)
+            latencies.append(elapsed)
+            queries.append(request_stats.queries or 0)
+            assert response.status_code in (200, 302, 304), (path, response.status_code)
+        results[name] = summarize(latencies, time.perf_counter() - started, queries)
+        print(f"{name}: {results[name]}")
+    return results
+
+
+def _http_login(session, base_url, user_id):
+    page = session.get(f"{base_url}/login").text
+    token = re.search(r'name="csrf_token" type="hidden" value="([^"]+)"', page)
+    session.post(f"{base_url}/login", data={
+        "email": f"bench-user-{user_id}@example.com",
+        "password": BENCH_PASSWORD,
+        "csrf_token": token.group(1) if token else "",
+    })
+
+
+def run_http(routes, requests, ranges, seed, base_url, threads):
+    import requests as http
+
+    results = {}
+    for name in routes:
+        build_path, needs_login = ROUTES[name]
+        latencies, queries = [], []
+        lock = threading.Lock()
+        per_thread = max(1, requests // threads)
+
+        def worker(index):
+            rng = random.Random(seed + index)
+            session = http.Session()
+            if needs_login:
+                _http_login(session, base_url, rng.randint(*ranges["users"]))
+            local, local_queries = [], []
+            for _ in range(per_thread):
+                url = base_url + build_path(rng, ranges)
+                start = time.perf_counter()
+                response = session.get(url, allow_redirects=False)
+                local.append((time.perf_counter() - start) * 1000)
+                local_queries.append(query_count(response.headers) or 0)
+            with lock:
+                latencies.extend(local)
+                queries.extend(local_queries)
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        results[name] = summarize(latencies, time.perf_counter() - started, queries)
+        print(f"{name}: {results[name]}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--routes", nargs="+", choices=sorted(ROUTES), default=list(ROUTES))
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--base-url", help="benchmark a running server over HTTP instead of the test client")
+    parser.add_argument("--threads", type=int, default=8, help="concurrent HTTP clients (with --base-url)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="compare against a previous --output file")
+    args = parser.parse_args()
+
+    ranges = seeded_ranges()
+    if args.base_url:
+        routes = run_http(args.routes, args.requests, ranges, args.seed, args.base_url.rstrip("/"), args.threads)
+        mode = f"http x{args.threads}"
+    else:
+        routes = run_test_client(args.routes, args.requests, ranges, args.seed)
+        mode = "test_client"
+
+    results = {
+        "mode": mode,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "requests_per_route": args.requests,
+        "routes": routes,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Seed a synthetic corpus and measure /search.json latency.
+
+    python -m benchmarks.search --posts 100000 --queries 500
+"""
+import argparse
+import io
+import json
+import random
+import statistics
+import time
+
+from benchmarks.common import percentile
+from benchmarks.seed import VOCABULARY, _rendered, _rendered_columns, sentence
+from database import pool
+
+BENCH_EMAIL = "bench-search@example.com"
+
+
+def seed_posts(count, seed=42, batch_size=10000):
+    """Bulk load `count` posts through COPY; returns the benchmark author's id"""
+    rng = random.Random(seed)
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO users (email, password, first_name, last_name) VALUES (%s, '!', 'Bench', 'Search')
+            ON CONFLICT (email) DO UPDATE SET email = EXCLUDED.email
+            RETURNING id
+        """, (BENCH_EMAIL,))
+        author_id = cur.fetchone()[0]
+
+        for start in range(0, count, batch_size):
+            buf = io.StringIO()
+            for _ in range(min(batch_size, count - start)):
+                body = "".join(f"<p>{sentence(rng, 40)}.</p>" for _ in range(rng.randint(2, 6)))
+                # Rendered columns too: search snippets are built from body_html
+                buf.write("\t".join((
+                    sentence(rng, 6), sentence(rng, 10), "2025-01-01T00:00:00+00", body, _rendered(body),
+                    "Bench Search", "https://example.com/bench.jpg", str(author_id),
+                )) + "\n")
+            buf.seek(0)
+            cur.copy_expert(
+                f"COPY blog_post (title, subtitle, date, body, {', '.join(_rendered_columns('body_html'))}, "
+                "author, img_url, author_id) FROM STDIN", buf
+            )
+        cur.execute("ANALYZE blog_post")
+    return author_id
+
+
+def remove_posts(author_id):
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM blog_post WHERE author_id = %s", (author_id,))
+        cur.execute("DELETE FROM users WHERE id = %s", (author_id,))
+
+
+def run(queries, seed=7):
+    from main import app
+
+    rng = random.Random(seed)
+    client = app.test_client()
+    latencies = []
+    for _ in range(queries):
+        terms = " ".join(rng.sample(VOCABULARY, rng.randint(1, 2)))
+        start = time.perf_counter()
+        response = client.get("/search.json", query_string={"q": terms})
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.status_code
+    return {
+        "route": "/search.json",
+        "queries": queries,
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(max(latencies), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=100000, help="posts to seed (0 to reuse existing data)")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--keep", action="store_true", help="leave the seeded posts in place")
+    args = parser.parse_args()
+
+    author_id = seed_posts(args.posts) if args.posts else None
+    try:
+        print(json.dumps(run(args.queries), indent=2))
+    finally:
+        if author_id is not None and not args.keep:
+            remove_posts(author_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Bulk-load a synthetic blog into the configured database with COPY.
+
+    python -m benchmarks.seed --users 10000 --posts 100000 --comments 1000000 --follows 5000000
+    python -m benchmarks.seed --drop
+
+Seeded users have emails like bench-user-<n>@example.com and the password BENCH_PASSWORD,
+so --drop can remove everything it created (posts, comments and follows cascade). The schema
+must already be migrated (`flask --app main db upgrade`).
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from content import render_body
+from database import pool, repair_user_counters
+
+VOCABULARY = (
+    "python flask postgres database index query cache latency throughput server client request "
+    "response template render stream worker thread process memory disk network socket buffer "
+    "design pattern system service cloud deploy container kubernetes docker security token "
+    "password session cookie browser javascript style layout image video audio music travel "
+    "food recipe garden coffee mountain river ocean forest city history science physics "
+    "biology chemistry math algebra geometry statistics learning model neural vision language"
+).split()
+
+BENCH_EMAIL_PATTERN = "bench-user-%@example.com"
+BENCH_PASSWORD = "benchmark"
+
+
+def sentence(rng, words):
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words)).capitalize()
+
+
+class RowStream:
+    """File-like reader over a generator of COPY text lines, so seeding runs in constant memory."""
+
+    def __init__(self, lines):
+        self._lines = lines
+        self._buffer = ""
+
+    def read(self, size=-1):
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        while size < 0 or length < size:
+            try:
+                line = next(self._lines)
+            except StopIteration:
+                break
+            chunks.append(line)
+            length += len(line)
+        data = "".join(chunks)
+        if size < 0:
+            size = len(data)
+        self._buffer = data[size:]
+        return data[:size]
+
+    readline = read
+
+
+def _copy(cur, table, columns, lines):
+    start = time.perf_counter()
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", RowStream(lines))
+    print(f"  {table}: {cur.rowcount} rows in {time.perf_counter() - start:.1f}s")
+
+
+def _rendered_columns(html_column):
+    return (html_column, "excerpt", "word_count", "reading_minutes")
+
+
+def _rendered(raw):
+    """COPY fields for the sanitized HTML, excerpt, word count and reading time of a body"""
+    r = render_body(raw)
+    return f"{r['html']}\t{r['excerpt']}\t{r['word_count']}\t{r['reading_minutes']}"
+
+
+def _next_id(cur, table):
+    cur.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}")
+    return cur.fetchone()[0]
+
+
+def seed(users=10000, posts=100000, comments=1000000, follows=5000000, seed=42):
+    """Seed the given volumes; returns the first/last ids created for users and posts"""
+    rng = random.Random(seed)
+    password = generate_password_hash(BENCH_PASSWORD, method="pbkdf2:sha256", salt_length=8)
+    epoch = datetime(2020, 1, 1)
+
+    with pool.connection() as conn, conn.cursor() as cur:
+        # Counter triggers would fire once per row; recompute the counters in bulk afterwards instead
+        cur.execute("ALTER TABLE blog_post DISABLE TRIGGER USER")
+        cur.execute("ALTER TABLE followers DISABLE TRIGGER USER")
+
+        first_user = _next_id(cur, "users")
+        user_ids = range(first_user, first_user + users)
+        _copy(cur, "users", ("id", "email", "password", "first_name", "last_name", "username", "joined_date"), (
+            f"{uid}\tbench-user-{uid}@example.com\t{password}\tBench\tUser{uid}\tbench{uid}\t"
+            f"{epoch + timedelta(minutes=uid)}\n"
+            for uid in user_ids
+        ))
+
+        first_post = _next_id(cur, "blog_post")
+        post_ids = range(first_post, first_post + posts)
+
+        def post_lines():
+            for pid in post_ids:
+                body = "".join(f"<p>{sentence(rng, 40)}.</p>" for _ in range(rng.randint(2, 6)))
+                day = epoch + timedelta(minutes=10 * (pid - first_post))
+                yield (f"{pid}\t{sentence(rng, 6)}\t{sentence(rng, 10)}\t{day.isoformat()}+00\t{body}\t"
+                       f"{_rendered(body)}\tBench Author\thttps://example.com/bench.jpg\t{rng.choice(user_ids)}\n")
+
+        _copy(cur, "blog_post", ("id", "title", "subtitle", "date", "body", *_rendered_columns("body_html"),
+                                 "author", "img_url", "author_id"), post_lines())
+
+        def comment_lines():
+            for _ in range(comments):
+                # Skew comments toward a small set of hot posts, like real traffic
+                post_id = first_post + int(posts * rng.random() ** 3)
+                text = f"<p>{sentence(rng, 20)}</p>"
+                yield f"{text}\t{_rendered(text)}\t{rng.choice(user_ids)}\t{post_id}\n"
+
+        _copy(cur, "comment", ("text", *_rendered_columns("text_html"), "author_id", "post_id"), comment_lines())
+
+        def follow_lines():
+            per_user = min(follows // max(users, 1), users - 1)
+            for follower in user_ids:
+                followed_ids = [uid for uid in rng.sample(user_ids, per_user + 1) if uid != follower]
+                for followed in followed_ids[:per_user]:
+                    yield f"{follower}\t{followed}\t{epoch + timedelta(seconds=rng.randint(0, 10 ** 8))}\n"
+
+        _copy(cur, "followers", ("follower_id", "followed_id", "created_at"), follow_lines())
+
+        cur.execute("ALTER TABLE blog_post ENABLE TRIGGER USER")
+        cur.execute("ALTER TABLE followers ENABLE TRIGGER USER")
+        for table in ("users", "blog_post", "comment"):
+            cur.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))")
+
+    repair_user_counters()
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute("ANALYZE")
+
+    return {"users": [user_ids.start, user_ids.stop - 1], "posts": [post_ids.start, post_ids.stop - 1]}
+
+
+def seeded_ranges():
+    """First/last ids of the seeded users and posts already in the database"""
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT MIN(id), MAX(id) FROM users WHERE email LIKE %s", (BENCH_EMAIL_PATTERN,))
+        users = list(cur.fetchone())
+        cur.execute("""
+            SELECT MIN(bp.id), MAX(bp.id) FROM blog_post bp
+            JOIN users u ON u.id = bp.author_id WHERE u.email LIKE %s
+        """, (BENCH_EMAIL_PATTERN,))
+        posts = list(cur.fetchone())
+    if users[0] is None or posts[0] is None:
+        raise SystemExit("No benchmark data found; run `python -m benchmarks.seed` first.")
+    return {"users": users, "posts": posts}
+
+
+def drop():
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM users WHERE email LIKE %s", (BENCH_EMAIL_PATTERN,))
+        return cur.rowcount
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--posts", type=int, default=100000)
+    parser.add_argument("--comments", type=int, default=1000000)
+    parser.add_argument("--follows", type=int, default=5000000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--drop", action="store_true", help="delete previously seeded data and exit")
+    args = parser.parse_args()
+
+    if args.drop:
+        print(f"Removed {drop()} benchmark user(s) and their content.")
+        return
+    print(seed(args.users, args.posts, args.comments, args.follows, args.seed))
+
+
+if __name__ == "__main__":
+    main()
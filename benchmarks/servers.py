@@ -0,0 +1,103 @@
+"""Compare gunicorn worker modes (sync, threaded, green) on the same seeded data.
+
+    python -m benchmarks.seed
+    python -m benchmarks.servers --requests 2000 --threads 64 --output servers.json
+
+Each mode is started with gunicorn.conf.py (WEB_MODE=<mode>) on its own port, driven over
+HTTP by benchmarks.routes, then stopped. Worker counts come from the config's CPU sizing
+unless --workers is given. Green mode needs gevent and psycogreen installed.
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+from benchmarks.common import compare
+from benchmarks.routes import ROUTES, run_http
+from benchmarks.seed import seeded_ranges
+
+MODES = ("sync", "threaded", "green")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_until_up(base_url, timeout=30.0):
+    import requests as http
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            http.get(f"{base_url}/about", timeout=1)
+            return
+        except http.RequestException:
+            time.sleep(0.2)
+    raise SystemExit(f"server at {base_url} did not come up within {timeout}s")
+
+
+def start_server(mode, port, workers=None):
+    env = dict(os.environ, WEB_MODE=mode, PORT=str(port), WEB_ACCESS_LOG="/dev/null",
+               MAIL_IN_PROCESS_WORKER="false")
+    if workers:
+        env["WEB_CONCURRENCY"] = str(workers)
+    return subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+                            cwd=ROOT, env=env)
+
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--routes", nargs="+", choices=sorted(ROUTES), default=["get_all_posts_older", "show_post",
+                                                                               "profile", "search"])
+    parser.add_argument("--requests", type=int, default=1000, help="requests per route and mode")
+    parser.add_argument("--threads", type=int, default=32, help="concurrent HTTP clients")
+    parser.add_argument("--workers", type=int, help="override the CPU-based worker count")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="compare against a previous --output file")
+    args = parser.parse_args()
+
+    ranges = seeded_ranges()
+    routes = {}
+    for mode in args.modes:
+        base_url = f"http://127.0.0.1:{args.port}"
+        print(f"{mode}:")
+        process = start_server(mode, args.port, args.workers)
+        try:
+            wait_until_up(base_url)
+            for name, metrics in run_http(args.routes, args.requests, ranges, args.seed, base_url,
+                                          args.threads).items():
+                routes[f"{mode}:{name}"] = metrics
+        finally:
+            stop_server(process)
+
+    print(f"\n{'mode:route':<34}{'rps':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, metrics in routes.items():
+        print(f"{name:<34}{metrics['throughput_rps']:>10}{metrics['p50_ms']:>10}{metrics['p99_ms']:>10}")
+
+    results = {
+        "mode": f"http x{args.threads}",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "requests_per_route": args.requests,
+        "routes": routes,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
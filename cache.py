@@ -0,0 +1,201 @@
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # shared cache storage is optional
+    redis = None
+
+CACHE_CONFIG = {
+    'user_maxsize': int(os.getenv("USER_CACHE_SIZE", "1024")),
+    'user_ttl': float(os.getenv("USER_CACHE_TTL", "300")),
+    'page_maxsize': int(os.getenv("PAGE_CACHE_SIZE", "256")),
+    'page_ttl': float(os.getenv("PAGE_CACHE_TTL", "60")),
+    'redis_url': os.getenv("CACHE_REDIS_URL"),
+}
+
+
+class TTLCache:
+    """Bounded, thread-safe LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize=1024, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisStore:
+    """Cross-worker storage with the same get/set/delete interface as TTLCache."""
+
+    def __init__(self, url, prefix, ttl):
+        if redis is None:
+            raise RuntimeError("CACHE_REDIS_URL is set but the 'redis' package is not installed")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key):
+        raw = self.client.get(f"{self.prefix}{key}")
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key, value):
+        self.client.set(f"{self.prefix}{key}", pickle.dumps(value), ex=max(1, int(self.ttl)))
+
+    def delete(self, key):
+        self.client.delete(f"{self.prefix}{key}")
+
+    def clear(self):
+        for key in self.client.scan_iter(f"{self.prefix}*"):
+            self.client.delete(key)
+
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(f"{self.prefix}*"))
+
+
+class UserCache:
+    """Caches the row load_user builds a User from, keyed by user id.
+
+    Uses the in-process LRU by default. When CACHE_REDIS_URL is configured the
+    shared store is used instead, so an eviction in one worker is seen by all of them.
+    Entries remember when they were loaded; get() skips one older than `changed_at`, which
+    lets a session bypass copies other workers cached before it changed the user.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300.0, redis_url=None):
+        if redis_url:
+            self.store = RedisStore(redis_url, "blog:user:v3:", ttl)  # v3: (loaded_at, UserRow)
+        else:
+            self.store = TTLCache(maxsize, ttl)
+        self._stats_lock = threading.Lock()  # `+=` on an attribute is not atomic across threads
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id, changed_at=0.0):
+        entry = self.store.get(int(user_id))
+        row = entry[1] if entry is not None and entry[0] >= changed_at else None
+        with self._stats_lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return row
+
+    def set(self, user_id, row):
+        self.store.set(int(user_id), (time.time(), row))
+
+    def evict(self, user_id):
+        with self._stats_lock:
+            self.evictions += 1
+        self.store.delete(int(user_id))
+
+    def stats(self):
+        return {
+            "backend": type(self.store).__name__,
+            "size": len(self.store),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+user_cache = UserCache(CACHE_CONFIG['user_maxsize'], CACHE_CONFIG['user_ttl'], CACHE_CONFIG['redis_url'])
+
+
+class PageCache:
+    """Rendered pages for anonymous visitors, keyed by route, arguments and content version.
+
+    Write routes call bump() so every cached page built from older content stops matching.
+    With CACHE_REDIS_URL the version counter is shared, so a write in one worker
+    invalidates the pages held by the others; without it each worker only sees its own
+    bumps and other workers' entries age out after `ttl` seconds.
+    """
+
+    def __init__(self, maxsize=256, ttl=60.0, redis_url=None):
+        self.entries = TTLCache(maxsize, ttl)
+        self.client = None
+        if redis_url:
+            if redis is None:
+                raise RuntimeError("CACHE_REDIS_URL is set but the 'redis' package is not installed")
+            self.client = redis.Redis.from_url(redis_url)
+        self._lock = threading.Lock()
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def version(self):
+        if self.client is not None:
+            return int(self.client.get("blog:page_version") or 0)
+        return self._version
+
+    def bump(self):
+        if self.client is not None:
+            self.client.incr("blog:page_version")
+        else:
+            # A lost increment would leave stale pages matching the current version
+            with self._lock:
+                self._version += 1
+
+    def get(self, key, version):
+        entry = self.entries.get((version, key))
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def set(self, key, version, entry):
+        # `version` is read before rendering, so a bump mid-render can't file stale HTML under the new version
+        self.entries.set((version, key), entry)
+
+    def stats(self):
+        return {
+            "version": self.version(),
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+        }
+
+
+page_cache = PageCache(CACHE_CONFIG['page_maxsize'], CACHE_CONFIG['page_ttl'], CACHE_CONFIG['redis_url'])
@@ -0,0 +1,173 @@
+import math
+import re
+from html import escape
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+# Markup CKEditor produces that is safe to render as-is; everything else is dropped
+ALLOWED_TAGS = {
+    'a', 'abbr', 'b', 'blockquote', 'br', 'code', 'div', 'em', 'figcaption', 'figure', 'h1', 'h2', 'h3', 'h4',
+    'h5', 'h6', 'hr', 'i', 'img', 'li', 'ol', 'p', 'pre', 's', 'span', 'strike', 'strong', 'sub', 'sup',
+    'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'tr', 'u', 'ul',
+}
+ALLOWED_ATTRIBUTES = {
+    'a': {'href', 'title'},
+    'abbr': {'title'},
+    'img': {'src', 'alt', 'title', 'width', 'height'},
+    'td': {'colspan', 'rowspan'},
+    'th': {'colspan', 'rowspan', 'scope'},
+}
+URL_ATTRIBUTES = {'href', 'src'}
+ALLOWED_SCHEMES = {'', 'http', 'https', 'mailto'}
+# Dropped together with everything inside them
+DROP_CONTENT_TAGS = {'script', 'style', 'iframe', 'object', 'embed', 'noscript', 'template', 'svg', 'math'}
+VOID_TAGS = {'br', 'hr', 'img'}
+# Tags that separate words when the body is flattened to text
+BLOCK_TAGS = {'blockquote', 'br', 'div', 'figcaption', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'li', 'p',
+              'pre', 'td', 'th', 'tr'}
+
+EXCERPT_WORDS = 40
+WORDS_PER_MINUTE = 200
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+class _Sanitizer(HTMLParser):
+    """Allowlist HTML cleaner that also collects the visible text."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self.text = []
+        self.open_tags = []
+        self.dropping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROP_CONTENT_TAGS:
+            if tag not in VOID_TAGS:
+                self.dropping += 1
+            return
+        if self.dropping:
+            return
+        if tag in BLOCK_TAGS:
+            self.text.append(' ')
+        if tag not in ALLOWED_TAGS:
+            return
+
+        allowed = ALLOWED_ATTRIBUTES.get(tag, set())
+        rendered = []
+        for name, value in attrs:
+            if name not in allowed or value is None:
+                continue
+            if name in URL_ATTRIBUTES and not _safe_url(value):
+                continue
+            rendered.append(f' {name}="{escape(value, quote=True)}"')
+        if tag == 'a':
+            rendered.append(' rel="nofollow noopener"')
+        self.out.append(f"<{tag}{''.join(rendered)}>")
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and self.open_tags and self.open_tags[-1] == tag:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping = max(0, self.dropping - 1)
+            return
+        if self.dropping or tag not in self.open_tags:
+            return
+        # Close anything left open inside this element so the output stays well-formed
+        while self.open_tags:
+            open_tag = self.open_tags.pop()
+            self.out.append(f"</{open_tag}>")
+            if open_tag == tag:
+                break
+        if tag in BLOCK_TAGS:
+            self.text.append(' ')
+
+    def handle_data(self, data):
+        if self.dropping:
+            return
+        self.out.append(escape(data, quote=False))
+        self.text.append(data)
+
+    def close(self):
+        super().close()
+        while self.open_tags:
+            self.out.append(f"</{self.open_tags.pop()}>")
+
+
+def _safe_url(value):
+    try:
+        return urlsplit(value.strip()).scheme.lower() in ALLOWED_SCHEMES
+    except ValueError:
+        return False
+
+
+def render_body(raw):
+    """Sanitize user HTML once at write time.
+
+    Returns the values stored next to the raw body: cleaned HTML, a plain-text excerpt,
+    the word count and an estimated reading time in minutes.
+    """
+    parser = _Sanitizer()
+    parser.feed(raw or '')
+    parser.close()
+
+    words = _WHITESPACE.sub(' ', ''.join(parser.text)).strip().split(' ')
+    words = [w for w in words if w]
+    excerpt = ' '.join(words[:EXCERPT_WORDS])
+    if len(words) > EXCERPT_WORDS:
+        excerpt += '…'
+    return {
+        'html': ''.join(parser.out),
+        'excerpt': excerpt,
+        'word_count': len(words),
+        'reading_minutes': max(1, math.ceil(len(words) / WORDS_PER_MINUTE)),
+    }
+
+
+# table -> (key, raw column, cleaned HTML column)
+RENDERED_COLUMNS = {
+    'blog_post': ('id', 'body', 'body_html'),
+    'comment': ('id', 'text', 'text_html'),
+}
+
+
+def backfill(conn, table, batch_size=500, everything=False, log=None):
+    """Render stored bodies in committed batches; `everything` re-renders rows already done. Returns rows updated"""
+    from psycopg2.extras import execute_values
+
+    key, raw_column, html_column = RENDERED_COLUMNS[table]
+    pending = "TRUE" if everything else f"{html_column} IS NULL"
+    last_id, updated = 0, 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT {key}, {raw_column} FROM {table}
+                WHERE {key} > %s AND {pending}
+                ORDER BY {key} LIMIT %s
+            """, (last_id, batch_size))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            values = []
+            for row_id, raw in rows:
+                rendered = render_body(raw)
+                values.append((row_id, rendered['html'], rendered['excerpt'], rendered['word_count'],
+                               rendered['reading_minutes']))
+            execute_values(cur, f"""
+                UPDATE {table} SET {html_column} = v.html, excerpt = v.excerpt,
+                       word_count = v.word_count, reading_minutes = v.reading_minutes
+                FROM (VALUES %s) AS v ({key}, html, excerpt, word_count, reading_minutes)
+                WHERE {table}.{key} = v.{key}
+            """, values)
+        conn.commit()
+        updated += len(rows)
+        if log:
+            log(f"  {table}: {updated} row(s)")
+    return updated
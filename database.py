@@ -1,94 +1,410 @@
+import importlib.util
+import itertools
+import logging
 import os
+import threading
+import time
+from contextlib import contextmanager
 
 import psycopg2
 from dotenv import load_dotenv
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+from instrumentation import InstrumentedCursor
+from statements import StatementConnection
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Database configuration from environment variables
 DB_CONFIG = {
     'dbname': os.getenv("DB_NAME", "postgres"),
     'user': os.getenv("DB_USER", "postgres"),
     'password': os.getenv("DB_PASSWORD", "9992"),
     'host': os.getenv("DB_HOST", "localhost"),
-    'port': os.getenv("DB_PORT", "5432")
+    'port': os.getenv("DB_PORT", "5432"),
+    'connect_timeout': int(os.getenv("DB_CONNECT_TIMEOUT", "5")),
+    # timestamptz values come back in UTC, matching the UTC month boundaries of /archive
+    'options': '-c timezone=UTC'
+}
+
+# Connection pool sizing and housekeeping
+POOL_CONFIG = {
+    'minconn': int(os.getenv("DB_POOL_MIN", "1")),
+    'maxconn': int(os.getenv("DB_POOL_MAX", "10")),
+    'timeout': float(os.getenv("DB_POOL_TIMEOUT", "10")),  # seconds to wait for a free connection
+    'recycle': float(os.getenv("DB_POOL_RECYCLE", "1800")),  # close connections older than this
+    'ping_after': float(os.getenv("DB_POOL_PING_AFTER", "30")),  # health check connections idle this long
 }
 
-# Create connection
-conn = psycopg2.connect(**DB_CONFIG)
+# Optional read replicas: comma-separated libpq URLs, e.g. postgresql://user:pw@replica1:5432/blog
+REPLICA_CONFIG = {
+    'urls': [url.strip() for url in os.getenv("DB_REPLICA_URLS", "").split(",") if url.strip()],
+    'retry_after': float(os.getenv("DB_REPLICA_RETRY_AFTER", "30")),  # skip a failed replica this long
+    'sticky_seconds': float(os.getenv("DB_PRIMARY_STICKY_SECONDS", "5")),  # read-your-writes window
+}
+
+
+class PoolTimeout(PoolError):
+    pass
+
+
+class ConnectionPool:
+    """Thread-safe psycopg2 pool that blocks (up to a timeout) when every connection is checked out."""
+
+    def __init__(self, db_config, minconn=1, maxconn=10, timeout=10.0, recycle=1800.0, ping_after=30.0):
+        self.db_config = db_config
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+
+        self._lock = threading.Condition()
+        self._idle = []  # (conn, created_at, returned_at), most recently returned last
+        self._created = {}  # id(conn) -> created_at for checked-out connections
+        self._size = 0
+        self._prefilled = False
+
+        self._checkouts = 0
+        self._exhausted = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._discarded = 0
+
+    def _connect(self):
+        return psycopg2.connect(**{'connection_factory': StatementConnection, 'cursor_factory': InstrumentedCursor,
+                                   **self.db_config})
+
+    def _prefill(self):
+        # Called with the lock held, on first checkout rather than at import time
+        self._prefilled = True
+        now = time.monotonic()
+        while self._size < self.minconn:
+            self._idle.append((self._connect(), now, now))
+            self._size += 1
+
+    def _is_usable(self, conn, created_at, returned_at, now):
+        if conn.closed:
+            return False
+        if self.recycle and now - created_at > self.recycle:
+            return False
+        if self.ping_after is not None and now - returned_at > self.ping_after:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def getconn(self, timeout=None):
+        """Check out a connection, waiting up to `timeout` (default DB_POOL_TIMEOUT) when all are in use"""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+
+        while True:
+            candidate = None
+            with self._lock:
+                if not self._prefilled:
+                    self._prefill()
+                while True:
+                    if self._idle:
+                        candidate = self._idle.pop()
+                        self._created[id(candidate[0])] = candidate[1]  # reserved while it is checked
+                        break
+
+                    if self._size < self.maxconn:
+                        self._size += 1
+                        break
+
+                    if not waited:
+                        waited = True
+                        self._exhausted += 1
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(f"no database connection available after {timeout}s")
+                    self._lock.wait(remaining)
+
+            if candidate is None:
+                break
+
+            # The health check may ping the server, so it runs without holding the lock
+            conn, created_at, returned_at = candidate
+            if self._is_usable(conn, created_at, returned_at, time.monotonic()):
+                with self._lock:
+                    self._checked_out(conn, created_at, start, waited)
+                return conn
+            with self._lock:
+                self._created.pop(id(conn), None)
+                self._discard(conn)
+                self._lock.notify()
+
+        # Open the new connection outside the lock so slow handshakes don't block other checkouts
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._lock:
+                self._size -= 1
+                self._lock.notify()
+            raise
+        with self._lock:
+            self._checked_out(conn, time.monotonic(), start, waited)
+        return conn
+
+    def _checked_out(self, conn, created_at, start, waited):
+        self._created[id(conn)] = created_at
+        self._checkouts += 1
+        if waited:
+            wait = time.monotonic() - start
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+
+    def _discard(self, conn):
+        # Called with the lock held
+        self._size -= 1
+        self._discarded += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def putconn(self, conn, close=False):
+        if not conn.closed and not close:
+            status = conn.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                close = True
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    close = True
+
+        with self._lock:
+            created_at = self._created.pop(id(conn), None)
+            if created_at is None:
+                raise PoolError("trying to put a connection that was not checked out from this pool")
+            if close or conn.closed:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, created_at, time.monotonic()))
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for code running outside a Flask request."""
+        conn = self.getconn()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self.putconn(conn)
+
+    def closeall(self):
+        with self._lock:
+            while self._idle:
+                self._discard(self._idle.pop()[0])
+            self._prefilled = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": len(self._created),
+                "max": self.maxconn,
+                "checkouts": self._checkouts,
+                "exhausted": self._exhausted,
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+                "wait_total_ms": round(self._wait_total * 1000, 3),
+                "wait_max_ms": round(self._wait_max * 1000, 3),
+            }
+
+
+pool = ConnectionPool(DB_CONFIG, **POOL_CONFIG)
+
 
+class ReplicaRouter:
+    """Hands out read connections round-robin across replica pools, falling back to the primary.
 
-def init_postgres_db():
+    A replica that refuses connections is skipped for `retry_after` seconds, and one whose pool
+    is exhausted is passed over for this read. With no replicas configured every read goes to
+    the primary pool.
+    """
+
+    def __init__(self, primary, replica_urls, retry_after=30.0):
+        self.primary = primary
+        self.replicas = [
+            ConnectionPool({'dsn': url, 'connect_timeout': DB_CONFIG['connect_timeout'],
+                            'options': DB_CONFIG['options']}, **POOL_CONFIG)
+            for url in replica_urls
+        ]
+        self.retry_after = retry_after
+        self._turn = itertools.count()  # next() on a count is atomic, so no lock is needed to rotate
+        self._lock = threading.Lock()
+        self._down_until = [0.0] * len(self.replicas)
+        self.failures = 0
+        self.busy = 0
+        self.fallbacks = 0
+
+    def read_connection(self):
+        """(pool, connection) to run read-only queries on; return the connection to that pool"""
+        count = len(self.replicas)
+        if count:
+            first = next(self._turn)
+            for offset in range(count):
+                index = (first + offset) % count
+                if self._down_until[index] > time.monotonic():
+                    continue
+                replica = self.replicas[index]
+                try:
+                    # A busy replica isn't waited for; the next one, or the primary, serves the read
+                    conn = replica.getconn(timeout=0)
+                except PoolTimeout:
+                    with self._lock:
+                        self.busy += 1
+                    continue
+                except psycopg2.OperationalError:
+                    logger.warning("replica %d unavailable, skipping it for %.0fs", index, self.retry_after,
+                                   exc_info=True)
+                    with self._lock:
+                        self._down_until[index] = time.monotonic() + self.retry_after
+                        self.failures += 1
+                    continue
+                return replica, conn
+            with self._lock:
+                self.fallbacks += 1
+        return self.primary, self.primary.getconn()
+
+    def closeall(self):
+        for replica in self.replicas:
+            replica.closeall()
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            "replicas": [dict(replica.stats(), down=self._down_until[i] > now)
+                         for i, replica in enumerate(self.replicas)],
+            "failures": self.failures,
+            "busy": self.busy,
+            "fallbacks": self.fallbacks,
+        }
+
+
+router = ReplicaRouter(pool, REPLICA_CONFIG['urls'], REPLICA_CONFIG['retry_after'])
+
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+# Arbitrary constant shared by every process that runs migrations against this database
+MIGRATION_LOCK_ID = 7_211_903
+
+
+def _migration_files():
+    """(version, path) for every migration on disk, oldest first"""
+    files = []
+    for name in sorted(os.listdir(MIGRATIONS_DIR)):
+        version, ext = os.path.splitext(name)
+        if ext in ('.sql', '.py') and version[:4].isdigit():
+            files.append((version, os.path.join(MIGRATIONS_DIR, name)))
+    return files
+
+
+def _apply(conn, path, log):
+    if path.endswith('.sql'):
+        with open(path) as f, conn.cursor() as cur:
+            cur.execute(f.read())
+        return
+    # Python migrations get the connection and the runner's log callback, and may commit between batches;
+    # they must be safe to re-run
+    spec = importlib.util.spec_from_file_location(f"migration_{os.path.basename(path)[:-3]}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.upgrade(conn, log)
+
+
+def applied_migrations(conn):
     with conn.cursor() as cur:
         cur.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                username VARCHAR(100),
-                first_name VARCHAR(100),
-                last_name VARCHAR(100),
-                email VARCHAR(150) UNIQUE,
-                password VARCHAR(200),
-                joined_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_admin BOOLEAN DEFAULT FALSE
-            )
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS blog_post (
-                id SERIAL PRIMARY KEY,
-                title TEXT NOT NULL,
-                subtitle TEXT NOT NULL,
-                date TEXT NOT NULL,
-                body TEXT NOT NULL,
-                author TEXT NOT NULL,
-                img_url TEXT NOT NULL,
-                author_id INTEGER NOT NULL,
-                FOREIGN KEY (author_id) REFERENCES users(id) ON DELETE CASCADE
-            )
-        """)
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS comment (
-                id SERIAL PRIMARY KEY,
-                text TEXT NOT NULL,
-                author_id INTEGER NOT NULL,
-                post_id INTEGER NOT NULL,
-                FOREIGN KEY (author_id) REFERENCES users (id) ON DELETE CASCADE,
-                FOREIGN KEY (post_id) REFERENCES blog_post (id) ON DELETE CASCADE
-            )
-        ''')
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS followers (
-                id SERIAL PRIMARY KEY,
-                follower_id INTEGER NOT NULL,
-                followed_id INTEGER NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(follower_id, followed_id),
-                FOREIGN KEY (follower_id) REFERENCES users(id) ON DELETE CASCADE,
-                FOREIGN KEY (followed_id) REFERENCES users(id) ON DELETE CASCADE
-            )
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS user_info (
-                id SERIAL PRIMARY KEY,
-                skill VARCHAR(100),
-                experience VARCHAR(100),
-                education VARCHAR(100),
-                occupation VARCHAR(100),
-                location VARCHAR(100),
-                profession VARCHAR(100),
-                website VARCHAR(150),
-                linkedin VARCHAR(100),
-                github VARCHAR(100),
-                twitter VARCHAR(100),
-                facebook VARCHAR(100),
-                instagram VARCHAR(100),
-                bio TEXT,
-                profile_image TEXT DEFAULT 'default.jpg',
-                profile_visibility BOOLEAN DEFAULT TRUE,
-                user_id INTEGER UNIQUE,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version TEXT PRIMARY KEY,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
             )
         """)
+        cur.execute("SELECT version FROM schema_migrations")
+        versions = {row[0] for row in cur.fetchall()}
+    conn.commit()
+    return versions
+
+
+def upgrade(log=print):
+    """Apply pending migrations in order, one transaction each; returns the versions applied.
+
+    A session-level advisory lock serialises concurrent runs (e.g. several release
+    containers starting at once); the second runner waits, then finds nothing to do.
+    """
+    applied = []
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
         conn.commit()
+        try:
+            done = applied_migrations(conn)
+            for version, path in _migration_files():
+                if version in done:
+                    continue
+                log(f"Applying {version}")
+                try:
+                    _apply(conn, path, log)
+                    with conn.cursor() as cur:
+                        cur.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                applied.append(version)
+        finally:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+            conn.commit()
+    return applied
+
 
+def pending_migrations():
+    with pool.connection() as conn:
+        done = applied_migrations(conn)
+    return [version for version, _ in _migration_files() if version not in done]
 
-init_postgres_db()
+
+def repair_user_counters():
+    """Recompute every user's post/follower/following counters in one pass; returns rows fixed"""
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            UPDATE users u
+            SET posts_count = c.posts_count,
+                followers_count = c.followers_count,
+                following_count = c.following_count
+            FROM (
+                SELECT u2.id,
+                       COALESCE(p.n, 0) AS posts_count,
+                       COALESCE(fr.n, 0) AS followers_count,
+                       COALESCE(fg.n, 0) AS following_count
+                FROM users u2
+                LEFT JOIN (SELECT author_id, COUNT(*) AS n FROM blog_post GROUP BY author_id) p
+                       ON p.author_id = u2.id
+                LEFT JOIN (SELECT followed_id, COUNT(*) AS n FROM followers GROUP BY followed_id) fr
+                       ON fr.followed_id = u2.id
+                LEFT JOIN (SELECT follower_id, COUNT(*) AS n FROM followers GROUP BY follower_id) fg
+                       ON fg.follower_id = u2.id
+            ) c
+            WHERE c.id = u.id
+              AND (u.posts_count, u.followers_count, u.following_count)
+                  IS DISTINCT FROM (c.posts_count, c.followers_count, c.following_count)
+        """)
+        return cur.rowcount
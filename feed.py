@@ -0,0 +1,109 @@
+import os
+
+# "read" merges followed authors' posts at request time; "write" copies each new post into
+# its author's followers' timelines so a feed page is one index range scan however many
+# authors the reader follows. Run `flask feed rebuild` after switching to "write".
+FEED_CONFIG = {
+    'mode': os.getenv("FEED_MODE", "read"),
+    'page_size': int(os.getenv("FEED_PAGE_SIZE", "10")),
+    'backfill': int(os.getenv("FEED_FOLLOW_BACKFILL", "100")),  # posts copied in when following someone
+}
+
+
+def fanout_on_write():
+    return FEED_CONFIG['mode'] == "write"
+
+
+def feed_page(cursor, user_id, before=None):
+    """Newest posts by authors `user_id` follows, older than post `before`; returns (posts, has_older)"""
+    limit = FEED_CONFIG['page_size']
+    params = {'user_id': user_id, 'before': before, 'limit': limit + 1}
+    if fanout_on_write():
+        cursor.execute('''
+            SELECT bp.id, bp.title, bp.subtitle, bp.date, bp.author, bp.author_id
+            FROM timeline t
+            JOIN blog_post bp ON bp.id = t.post_id
+            WHERE t.user_id = %(user_id)s
+              AND (%(before)s IS NULL OR (t.date, t.post_id) < (SELECT date, id FROM blog_post WHERE id = %(before)s))
+            ORDER BY t.date DESC, t.post_id DESC
+            LIMIT %(limit)s
+        ''', params)
+    else:
+        # One short index scan per followed author, merged and cut to a page
+        cursor.execute('''
+            SELECT p.id, p.title, p.subtitle, p.date, p.author, p.author_id
+            FROM followers f
+            CROSS JOIN LATERAL (
+                SELECT id, title, subtitle, date, author, author_id
+                FROM blog_post
+                WHERE author_id = f.followed_id
+                  AND (%(before)s IS NULL OR (date, id) < (SELECT date, id FROM blog_post WHERE id = %(before)s))
+                ORDER BY date DESC, id DESC
+                LIMIT %(limit)s
+            ) p
+            WHERE f.follower_id = %(user_id)s
+            ORDER BY p.date DESC, p.id DESC
+            LIMIT %(limit)s
+        ''', params)
+    posts = cursor.fetchall()
+    return posts[:limit], len(posts) > limit
+
+
+def on_post_created(cursor, post_id):
+    """Fan a new post out to its author's followers; runs inside the caller's transaction"""
+    if not fanout_on_write():
+        return
+    cursor.execute('''
+        INSERT INTO timeline (user_id, post_id, author_id, date)
+        SELECT f.follower_id, bp.id, bp.author_id, bp.date
+        FROM blog_post bp
+        JOIN followers f ON f.followed_id = bp.author_id
+        WHERE bp.id = %s
+        ON CONFLICT DO NOTHING
+    ''', (post_id,))
+
+
+def on_follow(cursor, follower_id, followed_id):
+    """Copy the followed author's recent posts into the follower's timeline"""
+    if not fanout_on_write():
+        return
+    cursor.execute('''
+        INSERT INTO timeline (user_id, post_id, author_id, date)
+        SELECT %s, id, author_id, date
+        FROM blog_post
+        WHERE author_id = %s
+        ORDER BY date DESC, id DESC
+        LIMIT %s
+        ON CONFLICT DO NOTHING
+    ''', (follower_id, followed_id, FEED_CONFIG['backfill']))
+
+
+def on_unfollow(cursor, follower_id, followed_id):
+    if not fanout_on_write():
+        return
+    cursor.execute("DELETE FROM timeline WHERE user_id = %s AND author_id = %s", (follower_id, followed_id))
+
+
+def rebuild_timelines(cursor, user_ids=None):
+    """Recreate timelines from followers (all users, or just `user_ids`); returns rows written"""
+    params = [FEED_CONFIG['backfill']]
+    if user_ids is None:
+        cursor.execute("TRUNCATE timeline")
+        only_users = ""
+    else:
+        cursor.execute("DELETE FROM timeline WHERE user_id = ANY(%s)", (list(user_ids),))
+        only_users = "WHERE f.follower_id = ANY(%s)"
+        params.append(list(user_ids))
+    cursor.execute(f'''
+        INSERT INTO timeline (user_id, post_id, author_id, date)
+        SELECT f.follower_id, p.id, p.author_id, p.date
+        FROM followers f
+        CROSS JOIN LATERAL (
+            SELECT id, author_id, date FROM blog_post
+            WHERE author_id = f.followed_id
+            ORDER BY date DESC, id DESC
+            LIMIT %s
+        ) p
+        {only_users}
+    ''', params)
+    return cursor.rowcount
@@ -1,7 +1,49 @@
+import colorsys
+import hashlib
+import hmac
+import io
+import logging
 import os
-import secrets
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
-from PIL import Image
+from PIL import Image, ImageDraw, ImageOps
+
+# Square avatar sizes used by the templates (header 40, comments 50, profile 125/160) plus 2x for HiDPI
+AVATAR_SIZES = (40, 50, 125, 160)
+AVATAR_VARIANT_SIZES = sorted({s * scale for s in AVATAR_SIZES for scale in (1, 2)})
+AVATAR_FORMATS = {'webp': ('WEBP', {'quality': 80, 'method': 4}), 'jpg': ('JPEG', {'quality': 85, 'optimize': True})}
+
+_IDENTICON_KEY = re.compile(r'^[0-9a-f]{24}$')
+
+# Content-addressed uploads are named "<24 hex chars>.jpg"; older random names have 16 hex chars
+_HASHED_NAME = re.compile(r'^[0-9a-f]{24}\.jpg$')
+# Any file built from an upload: the plain "<digest>.jpg" or a "<digest>_<size>.<ext>" variant
+_UPLOAD_FILE = re.compile(r'^([0-9a-f]{24})(?:_\d+\.(?:jpg|webp)|\.jpg)$')
+
+logger = logging.getLogger(__name__)
+
+
+def _make_executor(workers):
+    # Under gevent (WEB_MODE=green) patched threads are greenlets, and resizing would stall the
+    # event loop; gevent's pool runs the work on real OS threads instead
+    try:
+        from gevent import monkey
+    except ImportError:
+        monkey = None
+    if monkey is not None and monkey.is_module_patched('threading'):
+        from gevent.threadpool import ThreadPoolExecutor as RealThreadPoolExecutor
+        return RealThreadPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="avatar")
+
+
+_executor = _make_executor(int(os.getenv("AVATAR_WORKERS", "2")))
+# Originals wait here until their variants are built; outside static/ so they are never served
+AVATAR_SOURCE_DIR = os.getenv("AVATAR_SOURCE_DIR", "avatar_sources")
+_pending = {}
+_pending_lock = threading.Lock()
 
 
 # Ensure the upload directory exists
@@ -12,26 +54,167 @@ def ensure_upload_dir():
     return upload_dir
 
 
+def _source_path(digest):
+    os.makedirs(AVATAR_SOURCE_DIR, exist_ok=True)
+    return os.path.join(AVATAR_SOURCE_DIR, f"{digest}.src")
+
+
 # ------------Function to save and resize image----------------
 def allowed_file(filename):
     return '.' in filename and \
         filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg', 'gif'}
 
 
+def avatar_variant(filename, size, fmt='jpg'):
+    """Filename of the `size`px variant of an uploaded avatar; legacy single-size uploads map to themselves"""
+    if not _HASHED_NAME.match(filename):
+        return filename
+    return f"{filename[:-4]}_{size}.{fmt}"
+
+
+def _write_atomic(path, image, fmt, options):
+    # Unique per writer, so two workers rendering the same file can't interleave their bytes
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    image.save(tmp_path, fmt, **options)
+    os.replace(tmp_path, path)
+
+
+def _render_variants(data, digest, upload_dir):
+    try:
+        image = Image.open(io.BytesIO(data))
+        # Let the JPEG decoder downscale by 1/2, 1/4 or 1/8 while decoding instead of inflating the full image
+        image.draft('RGB', (max(AVATAR_VARIANT_SIZES),) * 2)
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+        largest = ImageOps.fit(image, (max(AVATAR_VARIANT_SIZES),) * 2, Image.LANCZOS)
+        if largest.mode == 'RGBA':
+            flattened = Image.new('RGB', largest.size, (255, 255, 255))
+            flattened.paste(largest, mask=largest.split()[3])
+            largest = flattened
+
+        for size in sorted(AVATAR_VARIANT_SIZES, reverse=True):
+            variant = largest if size == largest.width else largest.resize((size, size), Image.LANCZOS)
+            for ext, (fmt, options) in AVATAR_FORMATS.items():
+                _write_atomic(os.path.join(upload_dir, f"{digest}_{size}.{ext}"), variant, fmt, options)
+
+        # The plain "<digest>.jpg" is written last, so its presence means every variant exists
+        _write_atomic(os.path.join(upload_dir, f"{digest}.jpg"), largest.resize((125, 125), Image.LANCZOS),
+                      *AVATAR_FORMATS['jpg'])
+        # Variants are re-encoded without EXIF, so the original (and its metadata) isn't kept once they exist
+        try:
+            os.remove(_source_path(digest))
+        except FileNotFoundError:
+            pass
+    except Exception:
+        logger.exception("could not build avatar variants for %s", digest)
+    finally:
+        with _pending_lock:
+            _pending.pop(digest, None)
+
+
 def save_picture(file):
-    # Ensure upload directory exists
+    """Store an upload under a content hash and build its size variants in the background.
+
+    Returns the filename to record in user_info.profile_image straight away; identical
+    uploads resolve to the same name and are only processed once.
+    """
     upload_dir = ensure_upload_dir()
+    data = file.read()
+
+    # Decode the whole file in the request so truncated or corrupt images are rejected here rather
+    # than failing later in the background; draft() keeps large JPEGs cheap to decode
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft('RGB', (max(AVATAR_VARIANT_SIZES),) * 2)
+        image.load()
 
-    # Generate random filename
-    random_hex = secrets.token_hex(8)
-    _, file_extension = os.path.splitext(file.filename)
-    picture_filename = random_hex + file_extension
-    picture_path = os.path.join(upload_dir, picture_filename)
+    digest = hashlib.sha256(data).hexdigest()[:24]
+    picture_filename = f"{digest}.jpg"
+    if os.path.exists(os.path.join(upload_dir, picture_filename)):
+        return picture_filename
 
-    # Resize and save image
-    output_size = (125, 125)
-    i = Image.open(file)
-    i.thumbnail(output_size)
-    i.save(picture_path)
+    # The original is kept until the variants are written, so ensure_avatar can rebuild them if the job fails
+    source_path = _source_path(digest)
+    tmp_path = f"{source_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, source_path)
 
+    _submit_variants(data, digest, upload_dir)
     return picture_filename
+
+
+def _submit_variants(data, digest, upload_dir):
+    with _pending_lock:
+        if digest not in _pending:
+            _pending[digest] = _executor.submit(_render_variants, data, digest, upload_dir)
+        return _pending[digest]
+
+
+def ensure_avatar(filename, timeout=30.0):
+    """Make sure an uploaded avatar file exists before it is served.
+
+    Waits for a variant job that is still running, or rebuilds the variants from the kept
+    original (or the largest variant) when one is missing. Legacy and unknown names are left alone.
+    """
+    match = _UPLOAD_FILE.match(filename)
+    if not match:
+        return
+    upload_dir = ensure_upload_dir()
+    if os.path.exists(os.path.join(upload_dir, filename)):
+        return
+    digest = match.group(1)
+    with _pending_lock:
+        future = _pending.get(digest)
+    if future is None:
+        # Without the original (deleted once variants exist) the largest variant is the best source left
+        source_path = _source_path(digest)
+        if not os.path.exists(source_path):
+            source_path = os.path.join(upload_dir, f"{digest}_{max(AVATAR_VARIANT_SIZES)}.jpg")
+        if not os.path.exists(source_path):
+            return
+        with open(source_path, 'rb') as f:
+            future = _submit_variants(f.read(), digest, upload_dir)
+    try:
+        future.result(timeout)
+    except Exception:
+        logger.warning("avatar %s is still not available", filename)
+
+
+# ------------Identicons for users without a profile picture----------------
+@lru_cache(maxsize=4096)
+def identicon_key(email, secret):
+    """Stable avatar key for an email; keyed with the app secret so the URL doesn't reveal the address"""
+    return hmac.new(secret.encode(), (email or '').strip().lower().encode(), hashlib.sha256).hexdigest()[:24]
+
+
+def is_identicon_key(key):
+    return bool(_IDENTICON_KEY.match(key))
+
+
+def _draw_identicon(key, size):
+    # 5x5 grid mirrored around the middle column, coloured from the key
+    digest = bytes.fromhex(key)
+    hue = int.from_bytes(digest[:2], 'big') / 65535
+    foreground = tuple(round(c * 255) for c in colorsys.hls_to_rgb(hue, 0.5, 0.55))
+    image = Image.new('RGB', (size, size), (240, 240, 240))
+    draw = ImageDraw.Draw(image)
+    cell = size * 4 // 25  # 5 cells across 4/5 of the image, leaving a margin
+    offset = (size - cell * 5) // 2
+    bits = int.from_bytes(digest[2:], 'big')
+    for row in range(5):
+        for column in range(3):
+            if bits >> (row * 3 + column) & 1:
+                for x in {column, 4 - column}:
+                    left, top = offset + x * cell, offset + row * cell
+                    draw.rectangle((left, top, left + cell - 1, top + cell - 1), fill=foreground)
+    return image
+
+
+@lru_cache(maxsize=2048)
+def identicon_png(key, size):
+    """PNG bytes of the `size`px identicon for `key`; drawn in memory, the most recent ones kept"""
+    out = io.BytesIO()
+    _draw_identicon(key, size).save(out, 'PNG', optimize=True)
+    return out.getvalue()
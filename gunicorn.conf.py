@@ -0,0 +1,82 @@
+"""Gunicorn settings, sized from the CPUs this process may run on.
+
+WEB_MODE picks the worker model:
+  sync      one request per worker process (2 x CPUs + 1 workers)
+  threaded  gthread workers, WEB_THREADS requests per process (CPUs + 1 workers)
+  green     gevent workers, WEB_GREEN_CONNECTIONS requests per process (one per CPU);
+            needs `pip install gevent psycogreen`
+
+Each worker holds up to DB_POOL_MAX database connections, so keep
+workers x DB_POOL_MAX below the server's max_connections. In threaded and green
+mode requests beyond the pool size wait up to DB_POOL_TIMEOUT for a connection.
+"""
+import os
+
+mode = os.getenv("WEB_MODE", "sync")
+if mode not in ("sync", "threaded", "green"):
+    raise RuntimeError(f"WEB_MODE must be sync, threaded or green, not {mode!r}")
+
+if mode == "green":
+    # Patch before the app is imported (preload_app) so every lock and socket it creates is cooperative,
+    # and give psycopg2 a wait callback so queries yield to other greenlets instead of blocking the worker
+    try:
+        from gevent import monkey
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        raise RuntimeError("WEB_MODE=green needs gevent and psycogreen (pip install gevent psycogreen)")
+    monkey.patch_all()
+    patch_psycopg()
+
+try:
+    cpus = len(os.sched_getaffinity(0))  # honours container CPU pinning
+except AttributeError:
+    cpus = os.cpu_count() or 1
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+if mode == "sync":
+    default_workers = 2 * cpus + 1
+elif mode == "threaded":
+    default_workers = cpus + 1
+    worker_class = "gthread"
+    threads = int(os.getenv("WEB_THREADS", "8"))
+else:
+    default_workers = cpus
+    worker_class = "gevent"
+    worker_connections = int(os.getenv("WEB_GREEN_CONNECTIONS", "100"))
+workers = int(os.getenv("WEB_CONCURRENCY", str(default_workers)))
+
+# Importing the app does no database work, so loading it once in the master is cheap and
+# lets workers share its memory copy-on-write
+preload_app = os.getenv("WEB_PRELOAD", "true").lower() == "true"
+timeout = int(os.getenv("WEB_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("WEB_KEEPALIVE", "5"))
+# Recycle workers now and then so slow leaks can't accumulate; jitter keeps them from restarting together
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "5000"))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.getenv("WEB_ACCESS_LOG", "-")
+
+
+def post_fork(server, worker):
+    # A preloaded master never checks out a connection, but make sure forks never share a socket
+    from database import pool, router
+    from mailer import MAIL_CONFIG, mail_worker
+
+    pool.closeall()
+    router.closeall()
+    # Start sending at boot so mail queued or waiting to retry before a restart goes out without a new notify()
+    if MAIL_CONFIG['in_process_worker']:
+        mail_worker.start()
+
+
+def worker_exit(server, worker):
+    from database import pool, router
+    from mailer import mail_worker
+    from stats import view_counter
+
+    mail_worker.stop()
+    view_counter.stop()  # writes buffered view counts while the pool is still open
+    pool.closeall()
+    router.closeall()
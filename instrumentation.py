@@ -0,0 +1,118 @@
+import contextvars
+import heapq
+import logging
+import os
+import re
+import time
+import warnings
+from collections import Counter
+
+import psycopg2.extensions
+
+slow_query_logger = logging.getLogger("blog.sql.slow")
+summary_logger = logging.getLogger("blog.sql")
+
+SQL_CONFIG = {
+    'slow_ms': float(os.getenv("SQL_SLOW_MS", "200")),  # log statements slower than this
+    'repeat_threshold': int(os.getenv("SQL_REPEAT_THRESHOLD", "10")),  # same statement more often => N+1
+    'repeat_raise': os.getenv("SQL_REPEAT_RAISE", "false").lower() == "true",
+    'keep_slowest': 5,
+}
+
+_WHITESPACE = re.compile(r"\s+")
+_NUMBER = re.compile(r"\b\d+\b")
+
+
+class RepeatedQueryWarning(UserWarning):
+    """The same normalized statement ran more often in one request than SQL_REPEAT_THRESHOLD allows."""
+
+
+def normalize(sql):
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    return _NUMBER.sub("?", _WHITESPACE.sub(" ", str(sql)).strip())
+
+
+class QueryStats:
+    """Statements executed while handling one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.count = 0
+        self.total = 0.0
+        self.statements = Counter()
+        self._slowest = []  # min-heap of (duration, sequence, statement)
+
+    def record(self, sql, duration):
+        statement = normalize(sql)
+        self.count += 1
+        self.total += duration
+        self.statements[statement] += 1
+        entry = (duration, self.count, statement)
+        if len(self._slowest) < SQL_CONFIG['keep_slowest']:
+            heapq.heappush(self._slowest, entry)
+        else:
+            heapq.heappushpop(self._slowest, entry)
+        if duration * 1000 >= SQL_CONFIG['slow_ms']:
+            slow_query_logger.warning("%.1f ms: %s", duration * 1000, statement)
+
+    def slowest(self):
+        return [(round(d * 1000, 2), s) for d, _, s in sorted(self._slowest, reverse=True)]
+
+    def repeated(self):
+        threshold = SQL_CONFIG['repeat_threshold']
+        return {s: n for s, n in self.statements.items() if n > threshold}
+
+    def server_timing(self):
+        elapsed = (time.perf_counter() - self.started) * 1000
+        return f'db;dur={self.total * 1000:.2f};desc="{self.count} queries", app;dur={elapsed:.2f}'
+
+
+_current = contextvars.ContextVar("query_stats", default=None)
+
+
+def start_request():
+    stats = QueryStats()
+    return stats, _current.set(stats)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def finish_request(stats, endpoint):
+    """Log the request's query summary and flag repeated statements, once every statement has run"""
+    if summary_logger.isEnabledFor(logging.DEBUG):
+        summary_logger.debug("%s: %d queries in %.1f ms; slowest %s", endpoint, stats.count, stats.total * 1000,
+                             stats.slowest())
+    check_repeats(stats, endpoint)
+
+
+def check_repeats(stats, endpoint):
+    for statement, times in stats.repeated().items():
+        message = f"{endpoint} ran the same statement {times} times (possible N+1): {statement[:200]}"
+        if SQL_CONFIG['repeat_raise']:
+            raise RepeatedQueryWarning(message)
+        warnings.warn(message, RepeatedQueryWarning, stacklevel=2)
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """Cursor that reports every statement to the active request's QueryStats."""
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            stats = _current.get()
+            if stats is not None:
+                stats.record(query, time.perf_counter() - start)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            stats = _current.get()
+            if stats is not None:
+                stats.record(query, time.perf_counter() - start)
@@ -0,0 +1,163 @@
+import logging
+import os
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+
+from database import pool
+
+logger = logging.getLogger(__name__)
+
+# Outbound mail settings. Point host/port at a local debugging server (for example
+# `python -m aiosmtpd -n -l localhost:1025` with MAIL_SMTP_STARTTLS=false) to test without Gmail.
+MAIL_CONFIG = {
+    'host': os.getenv("MAIL_SMTP_HOST", "smtp.gmail.com"),
+    'port': int(os.getenv("MAIL_SMTP_PORT", "587")),
+    'starttls': os.getenv("MAIL_SMTP_STARTTLS", "true").lower() == "true",
+    'username': os.getenv("Your_SMTP_EMAIL"),
+    'password': os.getenv("Your_SMTP_PASSWORD"),
+    'sender': os.getenv("MAIL_SENDER") or os.getenv("Your_SMTP_EMAIL"),
+    'recipient': os.getenv("MAIL_RECIPIENT") or os.getenv("Your_SMTP_EMAIL"),
+    'timeout': float(os.getenv("MAIL_SMTP_TIMEOUT", "20")),
+    'batch_size': int(os.getenv("MAIL_BATCH_SIZE", "20")),
+    'poll_interval': float(os.getenv("MAIL_POLL_INTERVAL", "30")),
+    'idle_timeout': float(os.getenv("MAIL_SMTP_IDLE_TIMEOUT", "60")),  # close the SMTP session after this
+    'max_attempts': int(os.getenv("MAIL_MAX_ATTEMPTS", "6")),
+    'backoff_base': float(os.getenv("MAIL_BACKOFF_BASE", "30")),  # seconds, doubled on each retry
+    'in_process_worker': os.getenv("MAIL_IN_PROCESS_WORKER", "true").lower() == "true",
+}
+
+
+def enqueue_mail(cursor, to_addr, subject, body, reply_to=None):
+    """Persist a message for the worker; runs inside the caller's transaction"""
+    cursor.execute(
+        "INSERT INTO outbound_mail (from_addr, to_addr, subject, body, reply_to) VALUES (%s, %s, %s, %s, %s)",
+        (MAIL_CONFIG['sender'], to_addr, subject, body, reply_to)
+    )
+
+
+class MailWorker:
+    """Sends queued messages in batches over one long-lived SMTP session, retrying with backoff."""
+
+    def __init__(self, config):
+        self.config = config
+        self._smtp = None
+        self._last_used = 0.0
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    # ---- SMTP session ----
+    def _connection(self):
+        if self._smtp is not None and time.monotonic() - self._last_used > self.config['idle_timeout']:
+            self._close()
+        if self._smtp is None:
+            smtp = smtplib.SMTP(self.config['host'], self.config['port'], timeout=self.config['timeout'])
+            if self.config['starttls']:
+                smtp.starttls()
+            if self.config['username'] and self.config['password']:
+                smtp.login(self.config['username'], self.config['password'])
+            self._smtp = smtp
+        return self._smtp
+
+    def _close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
+
+    def _send(self, to_addr, subject, body, reply_to=None):
+        # Always send as our own account; visitor-supplied addresses only ever go in Reply-To
+        from_addr = self.config['sender']
+        message = EmailMessage()
+        message["From"] = from_addr
+        message["To"] = to_addr
+        if reply_to:
+            message["Reply-To"] = reply_to
+        message["Subject"] = subject
+        message.set_content(body)
+        try:
+            self._connection().send_message(message, from_addr=from_addr, to_addrs=[to_addr])
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped our idle session; reconnect once and retry
+            self._smtp = None
+            self._connection().send_message(message, from_addr=from_addr, to_addrs=[to_addr])
+        self._last_used = time.monotonic()
+
+    # ---- queue processing ----
+    def process_batch(self):
+        """Send one batch of due messages; returns how many rows were processed"""
+        with pool.connection() as conn, conn.cursor() as cur:
+            # SKIP LOCKED lets several workers drain the queue without sending a message twice
+            cur.execute("""
+                SELECT id, to_addr, subject, body, reply_to, attempts
+                FROM outbound_mail
+                WHERE status = 'pending' AND next_attempt_at <= now()
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            """, (self.config['batch_size'],))
+            batch = cur.fetchall()
+
+            for mail_id, to_addr, subject, body, reply_to, attempts in batch:
+                try:
+                    self._send(to_addr, subject, body, reply_to)
+                except Exception as e:  # a message that can't be built or sent must not stall the queue
+                    if isinstance(e, (smtplib.SMTPException, OSError)):
+                        self._close()
+                    attempts += 1
+                    status = 'failed' if attempts >= self.config['max_attempts'] else 'pending'
+                    delay = self.config['backoff_base'] * 2 ** (attempts - 1)
+                    logger.warning("mail %s attempt %s failed: %s", mail_id, attempts, e)
+                    cur.execute("""
+                        UPDATE outbound_mail
+                        SET attempts = %s, status = %s, last_error = %s,
+                            next_attempt_at = now() + make_interval(secs => %s)
+                        WHERE id = %s
+                    """, (attempts, status, str(e)[:500], delay, mail_id))
+                else:
+                    cur.execute(
+                        "UPDATE outbound_mail SET status = 'sent', sent_at = now(), attempts = %s WHERE id = %s",
+                        (attempts + 1, mail_id)
+                    )
+        return len(batch)
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                processed = self.process_batch()
+            except Exception:  # keep the worker alive; the next pass retries
+                logger.exception("mail worker batch failed")
+                processed = 0
+            if processed == self.config['batch_size']:
+                continue  # more may be waiting
+            if self._smtp is not None and time.monotonic() - self._last_used > self.config['idle_timeout']:
+                self._close()
+            self._wakeup.wait(self.config['poll_interval'])
+            self._wakeup.clear()
+        self._close()
+
+    def start(self):
+        """Start the background thread once per process"""
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self.run_forever, name="mail-worker", daemon=True)
+                self._thread.start()
+
+    def notify(self):
+        """Wake the worker after enqueueing so new mail doesn't wait for the next poll"""
+        if self.config['in_process_worker']:
+            self.start()
+            self._wakeup.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+
+mail_worker = MailWorker(MAIL_CONFIG)
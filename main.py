@@ -1,20 +1,38 @@
+import hashlib
+import html
 import os
-import smtplib
-from datetime import date, timedelta
+import re
+import time
+from datetime import date, datetime, timedelta, timezone
 from functools import wraps
+from urllib.parse import unquote, urlsplit
 
-import psycopg2
+import click
 from dotenv import load_dotenv
-from flask import Flask, render_template, redirect, url_for, request, flash, send_from_directory, abort
+from flask import Flask, render_template, redirect, url_for, request, flash, send_from_directory, abort, g, jsonify, \
+    make_response, session, stream_template, get_flashed_messages
+from flask.cli import AppGroup
 from flask_bootstrap import Bootstrap5
 from flask_ckeditor import CKEditor
-from flask_gravatar import Gravatar
 from flask_login import login_user, login_required, logout_user, LoginManager, UserMixin, current_user
+from flask_wtf.csrf import generate_csrf
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup, escape
 from werkzeug.security import check_password_hash, generate_password_hash
 
-from database import DB_CONFIG, init_postgres_db
+import assets
+import feed
+from cache import CACHE_CONFIG, page_cache, user_cache
+from content import RENDERED_COLUMNS, backfill, render_body
+from database import REPLICA_CONFIG, pending_migrations, pool, repair_user_counters, router, upgrade
 from forms import CreatePostForm, RegisterForm, LoginForm, CommentForm, EditProfileForm, ChangePasswordForm
-from functions import allowed_file, save_picture
+from functions import AVATAR_VARIANT_SIZES, allowed_file, avatar_variant, ensure_avatar, identicon_key, \
+    identicon_png, is_identicon_key, save_picture
+from instrumentation import end_request, finish_request, start_request
+from mailer import MAIL_CONFIG, enqueue_mail, mail_worker
+from statements import CommentRow, PostRow, UserRow, run
+from stats import STATS_CONFIG, refresh_trending, view_counter
+from transfer import ImportRecordError, export_posts, import_posts, read_records
 
 load_dotenv()
 
@@ -27,24 +45,42 @@ app.config['CKEDITOR_CDN_URL'] = 'https://cdn.ckeditor.com/4.25.1-lts/full/ckedi
 app.config['REMEMBER_COOKIE_DURATION'] = timedelta(days=7)
 app.config['REMEMBER_COOKIE_REFRESH_EACH_REQUEST'] = True
 app.config['UPLOAD_FOLDER'] = 'static/profile_pics'
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv("MAX_UPLOAD_MB", "8")) * 1024 * 1024  # 413 above this
+app.config['POSTS_PER_PAGE'] = int(os.getenv("POSTS_PER_PAGE", "10"))
+app.config['SEARCH_RESULTS_PER_PAGE'] = int(os.getenv("SEARCH_RESULTS_PER_PAGE", "10"))
+app.config['COMMENTS_PER_PAGE'] = int(os.getenv("COMMENTS_PER_PAGE", "20"))
+app.config['FOLLOWS_PER_PAGE'] = int(os.getenv("FOLLOWS_PER_PAGE", "50"))
+app.config['STREAM_ITERSIZE'] = int(os.getenv("STREAM_ITERSIZE", "100"))  # rows per server-side cursor fetch
+app.config['STREAM_BUFFER'] = int(os.getenv("STREAM_BUFFER", "32"))  # template events per streamed chunk
+# Compiled templates are kept on disk so freshly forked workers skip compiling them again
+# (defaults to a per-user directory under the system temp dir)
+template_cache_dir = os.getenv("TEMPLATE_CACHE_DIR")
+if template_cache_dir:
+    os.makedirs(template_cache_dir, exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(template_cache_dir)
 Bootstrap5(app)
 ckeditor = CKEditor(app)
 
+
+def send_static(filename):
+    # Uploaded avatars whose variants are still being built (or failed to build) are finished first
+    if filename.startswith('profile_pics/'):
+        if filename.endswith(('.src', '.tmp')):  # never serve an upload's original bytes
+            abort(404)
+        ensure_avatar(filename[len('profile_pics/'):])
+    return assets.send_static(filename)
+
+
+# Fingerprinted static files (see `flask assets build`)
+app.view_functions['static'] = send_static
+app.jinja_env.globals['url_for'] = assets.url_for
+app.jinja_env.globals['masthead_style'] = assets.masthead_style
+
 # Configure Flask-Login
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = "login"
 
-# For adding profile images to the comment section
-gravatar = Gravatar(app,
-                    size=50,
-                    rating='g',
-                    default='wavatar',
-                    force_default=False,
-                    force_lower=True,
-                    use_ssl=True,
-                    base_url=None)
-
 
 class User(UserMixin):
     def __init__(self, id, email, password, first_name, last_name, username=None, joined_date=None,
@@ -61,33 +97,24 @@ class User(UserMixin):
 
 @login_manager.user_loader
 def load_user(user_id):
-    with psycopg2.connect(**DB_CONFIG) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT u.id, u.email, u.password, u.first_name, u.last_name, 
-                   u.username, u.joined_date, ui.profile_image
-            FROM users u
-            LEFT JOIN user_info ui ON u.id = ui.user_id
-            WHERE u.id = %s
-        """, (user_id,))
-        user = cursor.fetchone()
-
-        if user:
-            return User(
-                id=user[0],
-                email=user[1],
-                password=user[2],
-                first_name=user[3],
-                last_name=user[4],
-                username=user[5],
-                joined_date=user[6],
-                image_file=user[7] or "default.jpg"  # Add this line
-            )
+    cached = user_cache.get(user_id, session.get('user_changed_at', 0.0))
+    if cached is not None:
+        return User(*cached)
+
+    with get_db_connection() as conn:
+        row = run(conn.cursor(), "load_user", (int(user_id),)).fetchone()
+
+    if row:
+        row = UserRow._make(row)
+        user_cache.set(user_id, row)
+        return User(*row)
     return None
 
 
-# Initialize the database
-init_postgres_db()
+def user_changed(user_id):
+    """Drop the cached row after the user is updated; other workers' copies are skipped for this session"""
+    user_cache.evict(user_id)
+    session['user_changed_at'] = time.time()
 
 
 def admin_only(f):
@@ -100,8 +127,95 @@ def admin_only(f):
     return decorated_function
 
 
+def cached_page(f):
+    """Serve anonymous GETs from the rendered-page cache, answering conditional requests with 304"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.method != "GET" or current_user.is_authenticated or session.get('_flashes'):
+            return f(*args, **kwargs)
+
+        key = (request.endpoint, tuple(sorted(kwargs.items())), tuple(sorted(request.args.items(multi=True))))
+        version = page_cache.version()
+        entry = page_cache.get(key, version)
+        if entry is None:
+            # Fill the cache from the primary so a lagging replica can't file stale HTML under a new version
+            g.db_primary = True
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            body = response.get_data()
+            last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+            entry = (body, hashlib.sha256(body).hexdigest(), last_modified, response.mimetype)
+            page_cache.set(key, version, entry)
+
+        body, etag, last_modified, mimetype = entry
+        response = app.response_class(body, mimetype=mimetype)
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.no_cache = True
+        response.vary.add('Cookie')
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            page_cache.record_not_modified()
+        return response
+
+    return decorated_function
+
+
+def reads_from_replica():
+    """GET/HEAD requests read from a replica unless this session wrote recently or the view needs the primary"""
+    return (request.method in ('GET', 'HEAD') and not g.get('db_primary')
+            and session.get('primary_until', 0) < time.time())
+
+
 def get_db_connection():
-    return psycopg2.connect(**DB_CONFIG)
+    """Return this request's pooled connection, checking one out on first use"""
+    if 'db_conn' not in g:
+        if reads_from_replica():
+            g.db_pool, g.db_conn = router.read_connection()
+        else:
+            g.db_pool, g.db_conn = pool, pool.getconn()
+    return g.db_conn
+
+
+@app.before_request
+def start_query_stats():
+    g.query_stats, g.query_stats_token = start_request()
+
+
+@app.after_request
+def add_server_timing(response):
+    # Headers leave before a streamed body is rendered, so for stream_page responses this only
+    # covers the queries run before streaming started; finish_request sees them all
+    stats = g.get('query_stats')
+    if stats is not None:
+        response.headers.add('Server-Timing', stats.server_timing())
+    return response
+
+
+@app.after_request
+def pin_session_to_primary(response):
+    # A write (any non-GET that touched the primary) keeps this session's reads on the primary
+    # for a while, so the author sees their own comment/post/follow before replicas catch up
+    if router.replicas and request.method not in ('GET', 'HEAD', 'OPTIONS') and g.get('db_pool') is pool:
+        session['primary_until'] = time.time() + REPLICA_CONFIG['sticky_seconds']
+    return response
+
+
+@app.teardown_request
+def end_query_stats(exception):
+    # Runs after a streamed body has been fully sent, so the listing and comment queries are included
+    token = g.pop('query_stats_token', None)
+    if token is not None:
+        end_request(token)
+        finish_request(g.query_stats, request.endpoint)
+
+
+@app.teardown_appcontext
+def release_db_connection(exception):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        g.pop('db_pool', pool).putconn(conn)
 
 
 # ------------ ROUTES -------------------- #
@@ -180,15 +294,233 @@ def logout():
     return redirect(url_for('get_all_posts'))
 
 
+class StreamedPage:
+    """A keyset page of rows read while a streamed template iterates it.
+
+    Everything above the listing is sent before the rows arrive; `older_url` and `newer_url`
+    are filled in once the loop has run, so the pager has to come after it.
+    """
+
+    def __init__(self, rows, page_size, links):
+        self.rows = rows
+        self.page_size = page_size
+        self.links = links  # (first row, last row, more rows left) -> (older_url, newer_url)
+        self.older_url = self.newer_url = None
+
+    def __iter__(self):
+        first = last = None
+        more = False
+        for n, row in enumerate(self.rows):
+            if n == self.page_size:
+                more = True
+                break
+            first = first or row
+            last = row
+            yield row
+        if hasattr(self.rows, 'close'):
+            self.rows.close()
+        self.older_url, self.newer_url = self.links(first, last, more)
+
+
+def stream_rows(name, sql, params):
+    """Yield rows from a server-side cursor on this request's connection, STREAM_ITERSIZE per round trip"""
+    cursor = get_db_connection().cursor(name=name)
+    cursor.itersize = app.config['STREAM_ITERSIZE']
+    try:
+        cursor.execute(sql, params)
+        yield from cursor
+    finally:
+        cursor.close()
+
+
+def stream_page(template_name, **context):
+    """Render a template as a streamed response body.
+
+    The session cookie goes out with the headers, before the template runs, so anything that
+    changes the session (loading the user, popping flashed messages, a form's CSRF token) is done
+    here first. For the same reason the Server-Timing header only covers queries run before
+    streaming; the repeated-statement check and query summary run at teardown and see them all.
+    """
+    current_user._get_current_object()
+    get_flashed_messages()
+    if 'form' in context:
+        generate_csrf()
+    return _buffered(stream_template(template_name, **context), app.config['STREAM_BUFFER'])
+
+
+def _buffered(events, size):
+    # Jinja yields every text run and expression separately; join them so each write carries some data
+    chunk = []
+    for event in events:
+        chunk.append(event)
+        if len(chunk) >= size:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+
+
+def list_posts(endpoint, start=None, end=None, **url_values):
+    """One keyset page of posts, newest first, optionally limited to [start, end), as a StreamedPage.
+
+    ?before=<id> walks to older posts and ?after=<id> back to newer ones; the cursor post's
+    (date, id) is looked up in SQL so every page is a range scan on idx_blog_post_date.
+    """
+    page_size = app.config['POSTS_PER_PAGE']
+    before = request.args.get('before', type=int)
+    after = request.args.get('after', type=int)
+    params = {'start': start, 'end': end, 'before': before, 'after': after, 'limit': page_size + 1}
+
+    if after is not None:
+        # Read oldest-first to find the page, so it has to be fetched whole and reversed
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, title, subtitle, date, author, author_id
+                FROM blog_post
+                WHERE (%(start)s IS NULL OR date >= %(start)s) AND (%(end)s IS NULL OR date < %(end)s)
+                  AND (date, id) > (SELECT date, id FROM blog_post WHERE id = %(after)s)
+                ORDER BY date ASC, id ASC LIMIT %(limit)s
+            ''', params)
+            posts = cursor.fetchall()
+        has_newer = len(posts) > page_size
+
+        def links(first, last, more):
+            older_url = url_for(endpoint, before=last[0], **url_values) if last else None
+            newer_url = url_for(endpoint, after=first[0], **url_values) if first and has_newer else None
+            return older_url, newer_url
+
+        return StreamedPage(posts[:page_size][::-1], page_size, links)
+
+    def links(first, last, more):
+        older_url = url_for(endpoint, before=last[0], **url_values) if last and more else None
+        newer_url = None
+        if before is not None:
+            newer_url = url_for(endpoint, after=first[0], **url_values) if first else url_for(endpoint, **url_values)
+        return older_url, newer_url
+
+    rows = stream_rows("list_posts", '''
+        SELECT id, title, subtitle, date, author, author_id
+        FROM blog_post
+        WHERE (%(start)s IS NULL OR date >= %(start)s) AND (%(end)s IS NULL OR date < %(end)s)
+          AND (%(before)s IS NULL OR (date, id) < (SELECT date, id FROM blog_post WHERE id = %(before)s))
+        ORDER BY date DESC, id DESC LIMIT %(limit)s
+    ''', params)
+    return StreamedPage(rows, page_size, links)
+
+
 @app.route('/')
+@cached_page
 def get_all_posts():
+    return stream_page("index.html", all_posts=list_posts('get_all_posts'), current_user=current_user,
+                       current_year=date.today().year)
+
+
+@app.route('/archive/<int:year>/<int:month>')
+@cached_page
+def archive(year, month):
+    if not 1 <= month <= 12 or not 1 <= year < 9999:
+        abort(404)
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+    posts = list_posts('archive', start, end, year=year, month=month)
+    return stream_page("archive.html", all_posts=posts, heading=start.strftime("%B %Y"), current_user=current_user)
+
+
+@app.route('/archive')
+@cached_page
+def archive_range():
+    # ?from=YYYY-MM-DD&to=YYYY-MM-DD, both inclusive days in UTC; either end may be left open
+    try:
+        start = request.args.get('from') and datetime.strptime(request.args['from'], "%Y-%m-%d")
+        end = request.args.get('to') and datetime.strptime(request.args['to'], "%Y-%m-%d") + timedelta(days=1)
+    except ValueError:
+        abort(400)
+    start = start.replace(tzinfo=timezone.utc) if start else None
+    end = end.replace(tzinfo=timezone.utc) if end else None
+    url_values = {k: request.args[k] for k in ('from', 'to') if request.args.get(k)}
+    posts = list_posts('archive_range', start, end, **url_values)
+    heading = " to ".join(request.args[k] for k in ('from', 'to') if request.args.get(k)) or "All posts"
+    return stream_page("archive.html", all_posts=posts, heading=heading, current_user=current_user)
+
+
+# Private-use characters mark the matches in ts_headline output until the snippet has been escaped
+HIGHLIGHT_START, HIGHLIGHT_STOP = "\ue000", "\ue001"
+HEADLINE_OPTIONS = (f'StartSel="{HIGHLIGHT_START}", StopSel="{HIGHLIGHT_STOP}", '
+                    "MaxFragments=2, MaxWords=30, MinWords=10")
+
+
+def highlight(snippet):
+    """Escape a ts_headline snippet and turn its match sentinels into <mark> tags"""
+    text = escape(html.unescape(snippet or ""))
+    return Markup(text.replace(HIGHLIGHT_START, Markup("<mark>")).replace(HIGHLIGHT_STOP, Markup("</mark>")))
+
+
+def search_posts(query, page):
+    """Rank posts against a web-style query; snippets are built in SQL for the returned page only"""
+    page_size = app.config['SEARCH_RESULTS_PER_PAGE']
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM blog_post ORDER BY id DESC")
-        posts = cursor.fetchall()
+        # Snippets come from the sanitized body with its tags stripped; the text is escaped again in highlight()
+        cursor.execute('''
+            SELECT id, title, subtitle, date, author, author_id,
+                   ts_headline('english', regexp_replace(body_html, '<[^>]*>', ' ', 'g'), query, %s)
+            FROM (
+                SELECT bp.id, bp.title, bp.subtitle, bp.date, bp.author, bp.author_id,
+                       COALESCE(bp.body_html, '') AS body_html, q AS query,
+                       ts_rank_cd(bp.search_vector, q) AS rank
+                FROM blog_post bp, websearch_to_tsquery('english', %s) q
+                WHERE bp.search_vector @@ q
+                ORDER BY rank DESC, bp.id DESC
+                LIMIT %s OFFSET %s
+            ) hits
+            ORDER BY rank DESC, id DESC
+        ''', (HEADLINE_OPTIONS, query, page_size + 1, (page - 1) * page_size))
+        results = [row[:6] + (highlight(row[6]),) for row in cursor.fetchall()]
+    return results[:page_size], len(results) > page_size
+
+
+@app.route("/search")
+def search():
+    query = request.args.get("q", "").strip()
+    page = max(request.args.get("page", 1, type=int), 1)
+    results, has_more = search_posts(query, page) if query else ([], False)
+    return render_template("search.html", query=query, results=results, page=page, has_more=has_more,
+                           current_user=current_user)
+
+
+@app.route("/search.json")
+def search_json():
+    query = request.args.get("q", "").strip()
+    page = max(request.args.get("page", 1, type=int), 1)
+    results, has_more = search_posts(query, page) if query else ([], False)
+    return jsonify(
+        query=query, page=page, has_more=has_more,
+        results=[{"id": r[0], "title": r[1], "subtitle": r[2], "date": r[3].isoformat(), "author": r[4],
+                  "author_id": r[5], "snippet": r[6], "url": url_for("show_post", post_id=r[0])}
+                 for r in results]
+    )
+
 
-    return render_template("index.html", all_posts=posts, current_user=current_user,
-                           current_year=date.today().year)
+def fetch_comments(cursor, post_id, before=None):
+    """Newest comments of a post older than `before`, keyset-paginated on idx_comment_post_id.
+
+    Returns the comments and the URL of the next (older) page, or None on the last page.
+    """
+    page_size = app.config['COMMENTS_PER_PAGE']
+    if before is None:
+        rows = run(cursor, "post_comments", (post_id, page_size + 1)).fetchall()
+    else:
+        rows = run(cursor, "older_comments", (post_id, before, page_size + 1)).fetchall()
+    comments = list(map(CommentRow._make, rows[:page_size]))
+
+    # Seed the per-request avatar memo so template lookups for commenters never hit the database
+    profile_image_memo().update((c.user_id, c.profile_image) for c in comments)
+
+    next_url = None
+    if len(rows) > page_size:
+        next_url = url_for("older_comments", post_id=post_id, before=comments[-1].id)
+    return comments, next_url
 
 
 @app.route("/post/<int:post_id>", methods=["GET", "POST"])
@@ -200,45 +532,39 @@ def show_post(post_id):
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
-                "INSERT INTO comment (text, author_id, post_id) VALUES (%s, %s, %s)",
-                (form.text.data, current_user.id, post_id)
+                '''
+                INSERT INTO comment (text, text_html, excerpt, word_count, reading_minutes, author_id, post_id)
+                VALUES (%(raw)s, %(html)s, %(excerpt)s, %(word_count)s, %(reading_minutes)s, %(author_id)s, %(post_id)s)
+                ''',
+                dict(render_body(form.text.data), raw=form.text.data, author_id=current_user.id, post_id=post_id)
             )
             conn.commit()
+        page_cache.bump()
         flash("Comment added successfully!", "success")
         return redirect(url_for("show_post", post_id=post_id))
 
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT bp.id, bp.title, bp.subtitle, bp.date, bp.body, bp.img_url, 
-                   bp.author_id, u.first_name || ' ' || u.last_name AS author
-            FROM blog_post bp
-            JOIN users u ON bp.author_id = u.id
-            WHERE bp.id = %s
-        ''', (post_id,))
-        post = cursor.fetchone()
+        post = run(conn.cursor(), "show_post", (post_id,)).fetchone()
 
-        if not post:
-            flash("Post not found.", "danger")
-            return redirect(url_for("get_all_posts"))
+    if not post:
+        flash("Post not found.", "danger")
+        return redirect(url_for("get_all_posts"))
+    view_counter.record(post_id)
 
-        post_data = {
-            "id": post[0], "title": post[1], "subtitle": post[2], "date": post[3],
-            "body": post[4], "img_url": post[5], "author_id": post[6], "author": post[7]
-        }
+    # The template loads comments once the post above them has been sent
+    return stream_page("post.html", post=PostRow._make(post),
+                       load_comments=lambda: fetch_comments(get_db_connection().cursor(), post_id),
+                       current_user=current_user, form=form)
 
-        cursor.execute('''
-            SELECT c.text, u.email, u.id, u.first_name || ' ' || u.last_name AS commenter_name
-            FROM comment c
-            JOIN users u ON c.author_id = u.id
-            WHERE c.post_id = %s
-            ORDER BY c.id DESC
-        ''', (post_id,))
-        comments = [{"text": c[0], "email": c[1], "user_id": c[2], "commenter_name": c[3]}
-                    for c in cursor.fetchall()]
 
-    return render_template("post.html", post=post_data, comments=comments,
-                           current_user=current_user, form=form)
+@app.route("/post/<int:post_id>/comments")
+@login_required
+def older_comments(post_id):
+    """Next page of comments older than ?before=<id>, as an HTML fragment plus the URL of the page after it"""
+    before = request.args.get("before", type=int)
+    with get_db_connection() as conn:
+        comments, next_url = fetch_comments(conn.cursor(), post_id, before)
+    return jsonify(html=render_template("comments.html", comments=comments), count=len(comments), next_url=next_url)
 
 
 @app.route("/new-post", methods=["GET", "POST"])
@@ -249,13 +575,18 @@ def add_new_post():
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                INSERT INTO blog_post (title, subtitle, date, body, author, img_url, author_id)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ''', (
-                form.title.data, form.subtitle.data, date.today().strftime("%B %d, %Y"),
-                form.body.data, form.author.data, form.img_url.data, current_user.id
+                INSERT INTO blog_post (title, subtitle, body, body_html, excerpt, word_count, reading_minutes,
+                                       author, img_url, author_id)
+                VALUES (%(title)s, %(subtitle)s, %(raw)s, %(html)s, %(excerpt)s, %(word_count)s, %(reading_minutes)s,
+                        %(author)s, %(img_url)s, %(author_id)s)
+                RETURNING id
+            ''', dict(
+                render_body(form.body.data), title=form.title.data, subtitle=form.subtitle.data, raw=form.body.data,
+                author=form.author.data, img_url=form.img_url.data, author_id=current_user.id
             ))
+            feed.on_post_created(cursor, cursor.fetchone()[0])
             conn.commit()
+        page_cache.bump()
         return redirect(url_for("get_all_posts"))
 
     return render_template("make-post.html", form=form, current_user=current_user)
@@ -268,7 +599,7 @@ def edit_post(post_id):
 
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM blog_post WHERE id = %s", (post_id,))
+        cursor.execute("SELECT id, title, subtitle, body, author, img_url FROM blog_post WHERE id = %s", (post_id,))
         post = cursor.fetchone()
 
         if not post:
@@ -276,19 +607,23 @@ def edit_post(post_id):
 
         if form.validate_on_submit():
             cursor.execute('''
-                UPDATE blog_post 
-                SET title=%s, body=%s, author=%s, img_url=%s, subtitle=%s 
-                WHERE id=%s
-            ''', (form.title.data, form.body.data, form.author.data,
-                  form.img_url.data, form.subtitle.data, post_id))
+                UPDATE blog_post
+                SET title=%(title)s, body=%(raw)s, body_html=%(html)s, excerpt=%(excerpt)s,
+                    word_count=%(word_count)s, reading_minutes=%(reading_minutes)s,
+                    author=%(author)s, img_url=%(img_url)s, subtitle=%(subtitle)s
+                WHERE id=%(post_id)s
+            ''', dict(render_body(form.body.data), title=form.title.data, raw=form.body.data,
+                      author=form.author.data, img_url=form.img_url.data, subtitle=form.subtitle.data,
+                      post_id=post_id))
             conn.commit()
+            page_cache.bump()
             flash("Post updated successfully!", "success")
             return redirect(url_for("show_post", post_id=post_id))
 
         form.title.data = post[1]
-        form.body.data = post[4]
-        form.author.data = post[5]
-        form.img_url.data = post[6]
+        form.body.data = post[3]
+        form.author.data = post[4]
+        form.img_url.data = post[5]
         form.subtitle.data = post[2]
 
     return render_template("make-post.html", form=form, is_edit=True, current_user=current_user)
@@ -301,10 +636,35 @@ def delete_post(post_id):
         cursor = conn.cursor()
         cursor.execute("DELETE FROM blog_post WHERE id = %s", (post_id,))
         conn.commit()
+    page_cache.bump()
     flash("Post deleted successfully!", "success")
     return redirect(url_for("get_all_posts"))
 
 
+@app.route("/metrics")
+@admin_only
+def metrics():
+    return jsonify(db_pool=pool.stats(), db_replicas=router.stats(), user_cache=user_cache.stats(),
+                   page_cache=page_cache.stats(), view_counter=view_counter.stats())
+
+
+@app.route("/trending")
+@cached_page
+def trending():
+    """Posts ranked by recent views and comments, as last computed by refresh_trending"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT bp.id, bp.title, bp.subtitle, bp.date, bp.author, bp.author_id, t.computed_at
+            FROM trending_posts t
+            JOIN blog_post bp ON bp.id = t.post_id
+            ORDER BY t.rank
+        ''')
+        posts = cursor.fetchall()
+    return render_template("trending.html", all_posts=posts, computed_at=posts[0][6] if posts else None,
+                           current_user=current_user)
+
+
 @app.route("/about")
 def about():
     return render_template("about.html", current_user=current_user)
@@ -315,6 +675,10 @@ def download():
     return send_from_directory("static", path="files/MudasirAbbas.pdf", as_attachment=True)
 
 
+# One address and nothing else: no display name, whitespace or line breaks that could reach a header
+CONTACT_EMAIL = re.compile(r'[^@\s<>,;"\x00-\x1f\x7f]{1,64}@[^@\s<>,;"\x00-\x1f\x7f]{1,189}\.[a-zA-Z]{2,63}')
+
+
 @app.route("/contact", methods=["GET", "POST"])
 def contact():
     if request.method == "POST":
@@ -323,33 +687,38 @@ def contact():
         phone = request.form.get("phone")
         message = request.form.get("message")
 
-        if not email:
-            flash("Please provide your email address.", "danger")
+        if not email or not CONTACT_EMAIL.fullmatch(email):
+            flash("Please provide a valid email address.", "danger")
             return render_template("contact.html", current_user=current_user)
 
-        smtp_email = os.getenv("Your_SMTP_EMAIL")
-        smtp_password = os.getenv("Your_SMTP_PASSWORD")
-
-        if not smtp_email or not smtp_password:
+        if not MAIL_CONFIG['recipient'] or not MAIL_CONFIG['sender']:
             flash("Server email configuration is missing.", "danger")
         else:
-            try:
-                with smtplib.SMTP("smtp.gmail.com", 587) as connection:
-                    connection.starttls()
-                    connection.login(smtp_email, smtp_password)
-                    connection.sendmail(
-                        from_addr=email,
-                        to_addrs=smtp_email,
-                        msg=f"Subject: User Alert\n\nName: {name}\nEmail: {email}\nPhone: {phone}\nMessage: {message}"
-                    )
-                flash("Message Sent Successfully", "success")
-            except smtplib.SMTPException as e:
-                flash(f"Failed to send email: {e}", "danger")
+            # Queue the message; the mail worker sends it outside the request
+            with get_db_connection() as conn:
+                cursor = conn.cursor()
+                enqueue_mail(cursor, MAIL_CONFIG['recipient'], "User Alert",
+                             f"Name: {name}\nEmail: {email}\nPhone: {phone}\nMessage: {message}", reply_to=email)
+            mail_worker.notify()
+            flash("Message Sent Successfully", "success")
 
     return render_template("contact.html", current_user=current_user)
 
 
 # -------------------- FOLLOW SYSTEM -------------------- #
+def local_next_url():
+    """The form's `next` field when it is a path on this site, so follow buttons can return to lists"""
+    target = request.form.get("next", "")
+    # Browsers read `\` as `/` and drop tabs and newlines, so `/\evil.example` or `/%09/evil.example`
+    # would leave the site; refuse those outright rather than trying to normalise them
+    if any(ch == "\\" or ord(ch) < 32 or ord(ch) == 127 for ch in target + unquote(target)):
+        return None
+    parts = urlsplit(target)
+    if parts.scheme or parts.netloc or not target.startswith("/") or target.startswith("//"):
+        return None
+    return target
+
+
 @app.route("/follow/<int:user_id>", methods=["POST"])
 @login_required
 def follow(user_id):
@@ -359,9 +728,23 @@ def follow(user_id):
             "INSERT INTO followers (follower_id, followed_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
             (current_user.id, user_id)
         )
+        if cursor.rowcount:
+            feed.on_follow(cursor, current_user.id, user_id)
         conn.commit()
     flash("You are now following this user!", "success")
-    return redirect(url_for("profile", user_id=user_id))
+    return redirect(local_next_url() or url_for("profile", user_id=user_id))
+
+
+@app.route("/feed")
+@login_required
+def home_feed():
+    before = request.args.get("before", type=int)
+    with get_db_connection() as conn:
+        posts, has_older = feed.feed_page(conn.cursor(), current_user.id, before)
+    older_url = url_for("home_feed", before=posts[-1][0]) if posts and has_older else None
+    newer_url = url_for("home_feed") if before is not None else None
+    return render_template("feed.html", all_posts=posts, older_url=older_url, newer_url=newer_url,
+                           current_user=current_user)
 
 
 @app.route("/unfollow/<int:user_id>", methods=["POST"])
@@ -373,43 +756,25 @@ def unfollow(user_id):
             "DELETE FROM followers WHERE follower_id=%s AND followed_id=%s",
             (current_user.id, user_id)
         )
+        feed.on_unfollow(cursor, current_user.id, user_id)
         conn.commit()
     flash("You unfollowed this user.", "info")
-    return redirect(url_for("profile", user_id=user_id))
+    return redirect(local_next_url() or url_for("profile", user_id=user_id))
 
 
 @app.route("/profile/<int:user_id>")
 @login_required
 def profile(user_id):
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT id, first_name, last_name, email, username FROM users WHERE id=%s", (user_id,))
-        user = cursor.fetchone()
-
-        if not user:
-            flash("User not found!", "danger")
-            return redirect(url_for("get_all_posts"))
+        row = run(conn.cursor(), "profile", (current_user.id, user_id)).fetchone()
 
-        cursor.execute('''
-            SELECT skill, experience, education, occupation, location, website, 
-                   linkedin, github, twitter, facebook, instagram, bio, profile_image
-            FROM user_info WHERE user_id=%s
-        ''', (user_id,))
-        user_info = cursor.fetchone()
-
-        cursor.execute("SELECT COUNT(*) FROM blog_post WHERE author_id=%s", (user_id,))
-        posts_count = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(*) FROM followers WHERE followed_id=%s", (user_id,))
-        followers_count = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(*) FROM followers WHERE follower_id=%s", (user_id,))
-        following_count = cursor.fetchone()[0]
+    if not row:
+        flash("User not found!", "danger")
+        return redirect(url_for("get_all_posts"))
 
-        cursor.execute("SELECT 1 FROM followers WHERE follower_id=%s AND followed_id=%s",
-                       (current_user.id, user_id))
-        is_user_following = cursor.fetchone() is not None
+    user = row[0:5]
+    user_info = row[5:18] if row[18] else None
+    posts_count, followers_count, following_count, is_user_following = row[19:23]
 
     return render_template("profile.html",
                            user=user, user_info=user_info, posts_count=posts_count,
@@ -418,35 +783,144 @@ def profile(user_id):
                            )
 
 
+# followers.<column> matched against the listed user -> column holding the users shown
+FOLLOW_LISTS = {
+    "followers": ("followed_id", "follower_id"),
+    "following": ("follower_id", "followed_id"),
+}
+
+
+@app.route("/profile/<int:user_id>/followers", defaults={"relation": "followers"})
+@app.route("/profile/<int:user_id>/following", defaults={"relation": "following"})
+@login_required
+def follow_list(user_id, relation):
+    """Keyset-paginated followers/following of a user in a fixed number of queries per page"""
+    match_column, listed_column = FOLLOW_LISTS[relation]
+    page_size = app.config['FOLLOWS_PER_PAGE']
+    before = request.args.get("before", type=int)
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, first_name, last_name, followers_count, following_count FROM users WHERE id = %s",
+                       (user_id,))
+        owner = cursor.fetchone()
+        if not owner:
+            abort(404)
+
+        # One query for the page: relationship rows, the listed users and their avatars
+        cursor.execute(f'''
+            SELECT f.id, u.id, u.first_name, u.last_name, u.username, u.email,
+                   COALESCE(ui.profile_image, 'default.jpg') AS profile_image
+            FROM followers f
+            JOIN users u ON u.id = f.{listed_column}
+            LEFT JOIN user_info ui ON ui.user_id = u.id
+            WHERE f.{match_column} = %(user_id)s
+              AND (%(before)s IS NULL OR (f.created_at, f.id) <
+                   (SELECT created_at, id FROM followers WHERE id = %(before)s AND {match_column} = %(user_id)s))
+            ORDER BY f.created_at DESC, f.id DESC
+            LIMIT %(limit)s
+        ''', {"user_id": user_id, "before": before, "limit": page_size + 1})
+        rows = cursor.fetchall()
+        people = [{"user_id": r[1], "name": f"{r[2]} {r[3]}", "username": r[4], "email": r[5],
+                   "profile_image": r[6] or "default.jpg"}
+                  for r in rows[:page_size]]
+
+        # And one for which of them the current user already follows
+        listed_ids = [p["user_id"] for p in people]
+        following = set()
+        if listed_ids:
+            cursor.execute("SELECT followed_id FROM followers WHERE follower_id = %s AND followed_id = ANY(%s)",
+                           (current_user.id, listed_ids))
+            following = {r[0] for r in cursor.fetchall()}
+
+    profile_image_memo().update((p["user_id"], p["profile_image"]) for p in people)
+    older_url = None
+    if len(rows) > page_size:
+        older_url = url_for("follow_list", user_id=user_id, relation=relation, before=rows[page_size - 1][0])
+    newer_url = url_for("follow_list", user_id=user_id, relation=relation) if before is not None else None
+    return render_template("follow_list.html", owner=owner, relation=relation, people=people, following=following,
+                           older_url=older_url, newer_url=newer_url, current_user=current_user)
+
+
+def profile_image_memo():
+    """Per-request map of user id -> profile image filename"""
+    if 'profile_images' not in g:
+        g.profile_images = {}
+    return g.profile_images
+
+
 @app.context_processor
 def utility_processor():
     def get_user_profile_image(user_id):
         """Get profile image for any user by ID"""
+        memo = profile_image_memo()
+        if user_id in memo:
+            return memo[user_id]
         try:
             with get_db_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute("SELECT profile_image FROM user_info WHERE user_id = %s", (user_id,))
                 result = cursor.fetchone()
-                return result[0] if result and result[0] else "default.jpg"
+                image = result[0] if result and result[0] else "default.jpg"
         except Exception:
             return "default.jpg"
+        memo[user_id] = image
+        return image
 
     def get_current_user_profile_image():
         """Get profile image for current user"""
         if not current_user.is_authenticated:
             return "default.jpg"
-        return get_user_profile_image(current_user.id)
+        # load_user already joined user_info, so there's nothing to look up
+        return current_user.image_file or "default.jpg"
+
+    def avatar_url(filename, size, fmt='jpg', scale=1):
+        """URL of the uploaded avatar variant closest to `size` CSS pixels"""
+        return url_for('static', filename='profile_pics/' + avatar_variant(filename, size * scale, fmt))
+
+    def avatar_srcset(filename, size, fmt='jpg'):
+        return f"{avatar_url(filename, size, fmt)} 1x, {avatar_url(filename, size, fmt, 2)} 2x"
 
     return dict(
         get_user_profile_image=get_user_profile_image,
-        get_current_user_profile_image=get_current_user_profile_image
+        get_current_user_profile_image=get_current_user_profile_image,
+        avatar_url=avatar_url,
+        avatar_srcset=avatar_srcset
     )
 
+
 @app.template_filter('file_exists')
 def file_exists_filter(filename):
     return os.path.exists(filename)
 
 
+@app.template_filter('post_date')
+def post_date_filter(value):
+    """Human-readable post date; timestamps are stored as timestamptz and only formatted here"""
+    return value.strftime("%B %d, %Y") if value else ""
+
+
+@app.template_filter('identicon')
+def identicon_filter(email, size=50):
+    """URL of the locally generated avatar for users without a profile picture"""
+    return url_for("identicon", key=identicon_key(email, app.config['SECRET_KEY']), size=size)
+
+
+@app.route("/avatars/<key>/<int:size>.png")
+def identicon(key, size):
+    # The image depends only on the URL, so browsers and proxies may keep it for good. Nothing is
+    # written to disk, so made-up keys cost a small render and a slot in a bounded LRU at most
+    if not is_identicon_key(key) or size not in AVATAR_VARIANT_SIZES:
+        abort(404)
+    response = make_response(identicon_png(key, size))
+    response.mimetype = "image/png"
+    response.set_etag(f"{key}-{size}")
+    response.cache_control.max_age = assets.FAR_FUTURE
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
+
+
 @app.route('/upload-profile-pic', methods=['GET', 'POST'])
 @login_required
 def upload_profile_pic():
@@ -475,6 +949,7 @@ def upload_profile_pic():
                         DO UPDATE SET profile_image = EXCLUDED.profile_image
                     """, (current_user.id, filename))
                     conn.commit()
+                user_changed(current_user.id)
 
                 flash('Your profile picture has been updated!', 'success')
                 return redirect(url_for('profile', user_id=current_user.id))
@@ -550,6 +1025,7 @@ def edit_profile():
                     form.profession.data, current_user.id
                 ))
                 conn.commit()
+                user_changed(current_user.id)
                 flash("Profile updated successfully!", "success")
                 return redirect(url_for("profile", user_id=current_user.id))
             except Exception as e:
@@ -572,10 +1048,154 @@ def change_password():
                 cursor = conn.cursor()
                 cursor.execute("UPDATE users SET password=%s WHERE id=%s", (new_hashed_password, current_user.id))
                 conn.commit()
+            user_changed(current_user.id)
             flash('Your password has been updated successfully!', 'success')
             return redirect(url_for('profile', user_id=current_user.id))
     return render_template('change_password.html', form=form)
 
 
+# -------------------- CLI -------------------- #
+db_cli = AppGroup("db", help="Database maintenance commands.")
+app.cli.add_command(db_cli)
+
+
+@db_cli.command("upgrade")
+def db_upgrade_command():
+    """Apply pending schema migrations from migrations/."""
+    applied = upgrade(log=click.echo)
+    click.echo(f"Applied {len(applied)} migration(s)." if applied else "Database is up to date.")
+
+
+@db_cli.command("status")
+def db_status_command():
+    """List migrations that have not been applied yet."""
+    pending = pending_migrations()
+    for version in pending:
+        click.echo(f"pending  {version}")
+    click.echo(f"{len(pending)} pending migration(s).")
+
+
+@db_cli.command("repair-counters")
+def repair_counters_command():
+    """Recompute denormalized post/follower/following counters for all users."""
+    click.echo(f"Repaired counters for {repair_user_counters()} user(s).")
+
+
+content_cli = AppGroup("content", help="Post and comment body commands.")
+app.cli.add_command(content_cli)
+
+
+@content_cli.command("backfill")
+@click.option("--all", "everything", is_flag=True, help="Re-render rows that already have sanitized HTML.")
+@click.option("--batch-size", default=500, show_default=True)
+def content_backfill_command(everything, batch_size):
+    """Sanitize and summarize stored post and comment bodies in batches."""
+    with pool.connection() as conn:
+        for table in RENDERED_COLUMNS:
+            rows = backfill(conn, table, batch_size, everything, log=click.echo)
+            click.echo(f"Rendered {rows} {table} row(s).")
+
+
+posts_cli = AppGroup("posts", help="Bulk post import and export.")
+app.cli.add_command(posts_cli)
+
+
+@posts_cli.command("import")
+@click.argument("paths", nargs=-1, required=True)
+@click.option("--default-author", help="Email of the user credited for records without author_email/author_id.")
+@click.option("--batch-size", default=1000, show_default=True)
+def posts_import_command(paths, default_author, batch_size):
+    """Load posts from NDJSON files ('-' for stdin) or Markdown files/directories with front matter."""
+    try:
+        with pool.connection() as conn:
+            posts, comments = import_posts(conn, read_records(paths), default_author, batch_size, log=click.echo)
+    except (ImportRecordError, OSError) as e:
+        raise click.ClickException(f"{e} (batches before this one were committed)")
+    # Only reaches running web workers through the shared CACHE_REDIS_URL counter
+    page_cache.bump()
+    click.echo(f"Imported {posts} post(s) and {comments} comment(s).")
+    if page_cache.client is None:
+        click.echo(f"Without CACHE_REDIS_URL, running web workers show the new posts to anonymous visitors "
+                   f"once their cached pages expire (PAGE_CACHE_TTL, {CACHE_CONFIG['page_ttl']:.0f}s).")
+    if feed.fanout_on_write():
+        click.echo("FEED_MODE is 'write'; run `flask feed rebuild` to add imported posts to timelines.")
+
+
+@posts_cli.command("export")
+@click.option("--output", "-o", default="-", show_default=True, help="NDJSON file to write, '-' for stdout.")
+def posts_export_command(output):
+    """Stream every post with its comments to NDJSON in constant memory."""
+    out = click.open_file(output, "w", encoding="utf-8")
+    with out, pool.connection() as conn:
+        written = export_posts(conn, out)
+    click.echo(f"Exported {written} post(s).", err=True)
+
+
+feed_cli = AppGroup("feed", help="Home feed commands.")
+app.cli.add_command(feed_cli)
+
+
+@feed_cli.command("rebuild")
+def feed_rebuild_command():
+    """Rebuild every materialized timeline from followers (run after switching to FEED_MODE=write)."""
+    with pool.connection() as conn, conn.cursor() as cursor:
+        rows = feed.rebuild_timelines(cursor)
+    click.echo(f"Wrote {rows} timeline row(s); FEED_MODE is {feed.FEED_CONFIG['mode']!r}.")
+
+
+mail_cli = AppGroup("mail", help="Outbound mail queue commands.")
+app.cli.add_command(mail_cli)
+
+
+@mail_cli.command("worker")
+def mail_worker_command():
+    """Run the outbound mail worker in the foreground (set MAIL_IN_PROCESS_WORKER=false on web processes)."""
+    click.echo(f"Sending queued mail via {MAIL_CONFIG['host']}:{MAIL_CONFIG['port']}")
+    try:
+        mail_worker.run_forever()
+    except KeyboardInterrupt:
+        mail_worker.stop()
+
+
+stats_cli = AppGroup("stats", help="View count and trending commands.")
+app.cli.add_command(stats_cli)
+
+
+@stats_cli.command("refresh-trending")
+def stats_refresh_trending_command():
+    """Recompute /trending now (web workers also refresh it every TRENDING_REFRESH_INTERVAL seconds)."""
+    rows = refresh_trending(force=True)
+    if rows is None:
+        click.echo("Another process is refreshing trending posts; try again shortly.")
+    else:
+        click.echo(f"Ranked {rows} post(s) over the last {STATS_CONFIG['window_days']} day(s).")
+
+
+@stats_cli.command("worker")
+def stats_worker_command():
+    """Refresh /trending every TRENDING_REFRESH_INTERVAL seconds (for STATS_IN_PROCESS_WORKER=false)."""
+    click.echo(f"Refreshing trending posts every {STATS_CONFIG['refresh_interval']:.0f}s")
+    try:
+        while True:
+            try:
+                refresh_trending()
+            except Exception as e:  # a database hiccup shouldn't end the worker
+                click.echo(f"Could not refresh trending posts: {e}", err=True)
+            time.sleep(STATS_CONFIG['refresh_interval'])
+    except KeyboardInterrupt:
+        pass
+
+
+assets_cli = AppGroup("assets", help="Static asset commands.")
+app.cli.add_command(assets_cli)
+
+
+@assets_cli.command("build")
+def assets_build_command():
+    """Write fingerprinted, precompressed and resized static assets to static/dist."""
+    manifest = assets.build()
+    click.echo(f"Built {len(manifest)} asset(s) into static/{assets.BUILD_DIR}.")
+
+
 if __name__ == "__main__":
     app.run(debug=True, port=5003)
\ No newline at end of file
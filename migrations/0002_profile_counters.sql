@@ -0,0 +1,47 @@
+-- Denormalized profile counters, kept current by triggers
+ALTER TABLE users
+    ADD COLUMN IF NOT EXISTS posts_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS followers_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS following_count INTEGER NOT NULL DEFAULT 0;
+
+-- followers(follower_id) lookups are already served by the UNIQUE(follower_id, followed_id) index
+CREATE INDEX IF NOT EXISTS idx_blog_post_author_id ON blog_post (author_id);
+CREATE INDEX IF NOT EXISTS idx_followers_followed_id ON followers (followed_id);
+
+CREATE OR REPLACE FUNCTION blog_post_count_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE users SET posts_count = posts_count + 1 WHERE id = NEW.author_id;
+    ELSE
+        UPDATE users SET posts_count = posts_count - 1 WHERE id = OLD.author_id;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION followers_count_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE users SET followers_count = followers_count + 1 WHERE id = NEW.followed_id;
+        UPDATE users SET following_count = following_count + 1 WHERE id = NEW.follower_id;
+    ELSE
+        UPDATE users SET followers_count = followers_count - 1 WHERE id = OLD.followed_id;
+        UPDATE users SET following_count = following_count - 1 WHERE id = OLD.follower_id;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS blog_post_count ON blog_post;
+CREATE TRIGGER blog_post_count AFTER INSERT OR DELETE ON blog_post
+FOR EACH ROW EXECUTE FUNCTION blog_post_count_trigger();
+
+DROP TRIGGER IF EXISTS followers_count ON followers;
+CREATE TRIGGER followers_count AFTER INSERT OR DELETE ON followers
+FOR EACH ROW EXECUTE FUNCTION followers_count_trigger();
+
+-- Backfill in the same transaction, so the counters are exact once the triggers take over
+UPDATE users u
+SET posts_count = (SELECT COUNT(*) FROM blog_post WHERE author_id = u.id),
+    followers_count = (SELECT COUNT(*) FROM followers WHERE followed_id = u.id),
+    following_count = (SELECT COUNT(*) FROM followers WHERE follower_id = u.id);
@@ -0,0 +1,9 @@
+-- Full-text search: a generated tsvector stays current on every INSERT/UPDATE of the source columns
+ALTER TABLE blog_post ADD COLUMN IF NOT EXISTS search_vector tsvector
+GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(subtitle, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(body, '')), 'C')
+) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_blog_post_search ON blog_post USING GIN (search_vector);
@@ -0,0 +1,17 @@
+-- Contact-form mail, sent by the background worker in mailer.py
+CREATE TABLE IF NOT EXISTS outbound_mail (
+    id SERIAL PRIMARY KEY,
+    from_addr TEXT NOT NULL,
+    to_addr TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    sent_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_outbound_mail_pending ON outbound_mail (next_attempt_at)
+WHERE status = 'pending';
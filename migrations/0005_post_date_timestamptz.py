@@ -0,0 +1,84 @@
+"""Convert blog_post.date from "%B %d, %Y" text to an indexed timestamptz.
+
+The new value is built in a side column and backfilled in committed batches, so a large
+table is never locked for the whole parse and an interrupted run resumes where it stopped.
+The swap at the end (drop text column, rename, index) is a single short transaction.
+"""
+from datetime import datetime, timezone
+
+from psycopg2.extras import execute_values
+
+BATCH_SIZE = 1000
+TEXT_FORMATS = ("%B %d, %Y", "%b %d, %Y", "%Y-%m-%d")
+
+
+def parse_post_date(text):
+    """Midnight UTC of a stored post date, or None when the text matches no known format"""
+    for fmt in TEXT_FORMATS:
+        try:
+            return datetime.strptime(text.strip(), fmt).replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+    return None
+
+
+def _column_type(cur, column):
+    cur.execute("""
+        SELECT data_type FROM information_schema.columns
+        WHERE table_name = 'blog_post' AND column_name = %s
+    """, (column,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def upgrade(conn, log):
+    with conn.cursor() as cur:
+        if _column_type(cur, 'date') == 'timestamp with time zone':
+            return
+        cur.execute("ALTER TABLE blog_post ADD COLUMN IF NOT EXISTS date_ts TIMESTAMPTZ")
+    conn.commit()
+
+    unparsed = []
+    last_id = 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT id, date FROM blog_post
+                WHERE id > %s AND date_ts IS NULL
+                ORDER BY id LIMIT %s
+            """, (last_id, BATCH_SIZE))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            values = []
+            for post_id, text in rows:
+                parsed = parse_post_date(text)
+                if parsed is None:
+                    unparsed.append(post_id)
+                    parsed = datetime(1970, 1, 1, tzinfo=timezone.utc)
+                values.append((post_id, parsed))
+            execute_values(cur, """
+                UPDATE blog_post SET date_ts = v.date_ts
+                FROM (VALUES %s) AS v (id, date_ts)
+                WHERE blog_post.id = v.id
+            """, values, template="(%s, %s::timestamptz)")
+        conn.commit()
+
+    if unparsed:
+        log(f"  {len(unparsed)} post date(s) could not be parsed and were set to 1970-01-01: "
+              f"ids {unparsed[:20]}{' ...' if len(unparsed) > 20 else ''}")
+
+    with conn.cursor() as cur:
+        # Rows inserted by the old code while the backfill ran are picked up here, under the lock
+        cur.execute("LOCK TABLE blog_post IN ACCESS EXCLUSIVE MODE")
+        cur.execute("SELECT id, date FROM blog_post WHERE date_ts IS NULL")
+        for post_id, text in cur.fetchall():
+            cur.execute("UPDATE blog_post SET date_ts = %s WHERE id = %s",
+                        (parse_post_date(text) or datetime(1970, 1, 1, tzinfo=timezone.utc), post_id))
+        cur.execute("ALTER TABLE blog_post DROP COLUMN date")
+        cur.execute("ALTER TABLE blog_post RENAME COLUMN date_ts TO date")
+        cur.execute("ALTER TABLE blog_post ALTER COLUMN date SET DEFAULT now(), ALTER COLUMN date SET NOT NULL")
+        # Serves newest-first listings, keyset pages and archive ranges
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_blog_post_date ON blog_post (date DESC, id DESC)")
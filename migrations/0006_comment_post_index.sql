@@ -0,0 +1,2 @@
+-- Serves "newest comments of a post" pages as a range scan, and the post_id foreign key on post deletes
+CREATE INDEX IF NOT EXISTS idx_comment_post_id ON comment (post_id, id);
@@ -0,0 +1,15 @@
+-- Per-author newest-first scans for the fan-out-on-read feed; supersedes the plain author_id index
+CREATE INDEX IF NOT EXISTS idx_blog_post_author_date ON blog_post (author_id, date DESC, id DESC);
+DROP INDEX IF EXISTS idx_blog_post_author_id;
+
+-- Materialized home timelines for FEED_MODE=write; date/author_id are copied from the post
+CREATE TABLE IF NOT EXISTS timeline (
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    post_id INTEGER NOT NULL REFERENCES blog_post (id) ON DELETE CASCADE,
+    author_id INTEGER NOT NULL,
+    date TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (user_id, post_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_timeline_user_date ON timeline (user_id, date DESC, post_id DESC);
+CREATE INDEX IF NOT EXISTS idx_timeline_post_id ON timeline (post_id);
@@ -0,0 +1,8 @@
+-- Keyset pages of a user's followers / following, newest first
+UPDATE followers SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+ALTER TABLE followers ALTER COLUMN created_at SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_followers_followed_created ON followers (followed_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_followers_follower_created ON followers (follower_id, created_at DESC, id DESC);
+-- Superseded by idx_followers_followed_created
+DROP INDEX IF EXISTS idx_followers_followed_id;
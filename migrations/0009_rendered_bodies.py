@@ -0,0 +1,22 @@
+"""Store sanitized HTML, an excerpt, a word count and a reading time next to post and comment bodies.
+
+Existing rows are rendered in committed batches; an interrupted run picks up the rows still
+missing their HTML. `flask content backfill --all` re-renders everything later, for example
+after the sanitizer's allowlist changes.
+"""
+from content import RENDERED_COLUMNS, backfill
+
+
+def upgrade(conn, log):
+    with conn.cursor() as cur:
+        for table, (_, _, html_column) in RENDERED_COLUMNS.items():
+            cur.execute(f"""
+                ALTER TABLE {table}
+                    ADD COLUMN IF NOT EXISTS {html_column} TEXT,
+                    ADD COLUMN IF NOT EXISTS excerpt TEXT,
+                    ADD COLUMN IF NOT EXISTS word_count INTEGER,
+                    ADD COLUMN IF NOT EXISTS reading_minutes INTEGER
+            """)
+    conn.commit()
+    for table in RENDERED_COLUMNS:
+        backfill(conn, table, log=log)
@@ -0,0 +1,23 @@
+-- Buffered view counts (stats.py) and the precomputed /trending list
+
+CREATE TABLE IF NOT EXISTS post_stats (
+    post_id INTEGER PRIMARY KEY REFERENCES blog_post (id) ON DELETE CASCADE,
+    views BIGINT NOT NULL DEFAULT 0,
+    -- views decayed exponentially as of updated_at
+    recent_views DOUBLE PRECISION NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_post_stats_updated_at ON post_stats (updated_at);
+
+CREATE TABLE IF NOT EXISTS trending_posts (
+    rank INTEGER PRIMARY KEY,
+    post_id INTEGER NOT NULL REFERENCES blog_post (id) ON DELETE CASCADE,
+    score DOUBLE PRECISION NOT NULL,
+    computed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Existing comments get no timestamp, so they don't all count as recent; new ones do
+ALTER TABLE comment ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ;
+ALTER TABLE comment ALTER COLUMN created_at SET DEFAULT now();
+CREATE INDEX IF NOT EXISTS idx_comment_created_at ON comment (created_at);
@@ -0,0 +1,3 @@
+-- Mail goes out From the site's own account; the visitor's address moves to Reply-To
+ALTER TABLE outbound_mail ADD COLUMN IF NOT EXISTS reply_to TEXT;
+UPDATE outbound_mail SET reply_to = from_addr WHERE status = 'pending' AND reply_to IS NULL;
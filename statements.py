@@ -0,0 +1,111 @@
+import os
+import re
+from collections import namedtuple
+
+from psycopg2 import extensions
+
+# Hot queries are PREPAREd once per pooled connection and then run with EXECUTE, so the server
+# parses and plans them once instead of on every request. Turn this off behind a
+# transaction-pooling proxy (pgbouncer pool_mode=transaction), where session state doesn't stick.
+STATEMENT_CONFIG = {
+    'prepare': os.getenv("DB_PREPARE", "true").lower() == "true",
+}
+
+# name -> (parameter types, SQL with $n placeholders)
+STATEMENTS = {
+    'load_user': (('integer',), '''
+        SELECT u.id, u.email, u.password, u.first_name, u.last_name, u.username, u.joined_date,
+               COALESCE(ui.profile_image, 'default.jpg')
+        FROM users u
+        LEFT JOIN user_info ui ON u.id = ui.user_id
+        WHERE u.id = $1
+    '''),
+    'show_post': (('integer',), '''
+        SELECT bp.id, bp.title, bp.subtitle, bp.date, bp.body_html, bp.img_url,
+               bp.author_id, u.first_name || ' ' || u.last_name AS author, bp.reading_minutes
+        FROM blog_post bp
+        JOIN users u ON bp.author_id = u.id
+        WHERE bp.id = $1
+    '''),
+    # First and older comment pages are separate statements: a generic plan for `$2 IS NULL OR c.id < $2`
+    # can't use the id bound in the index condition and filters every newer comment instead
+    'post_comments': (('integer', 'integer'), '''
+        SELECT c.id, c.text_html, u.email, u.id, u.first_name || ' ' || u.last_name AS commenter_name,
+               COALESCE(ui.profile_image, 'default.jpg') AS profile_image
+        FROM comment c
+        JOIN users u ON c.author_id = u.id
+        LEFT JOIN user_info ui ON ui.user_id = u.id
+        WHERE c.post_id = $1
+        ORDER BY c.id DESC
+        LIMIT $2
+    '''),
+    'older_comments': (('integer', 'integer', 'integer'), '''
+        SELECT c.id, c.text_html, u.email, u.id, u.first_name || ' ' || u.last_name AS commenter_name,
+               COALESCE(ui.profile_image, 'default.jpg') AS profile_image
+        FROM comment c
+        JOIN users u ON c.author_id = u.id
+        LEFT JOIN user_info ui ON ui.user_id = u.id
+        WHERE c.post_id = $1 AND c.id < $2
+        ORDER BY c.id DESC
+        LIMIT $3
+    '''),
+    'profile': (('integer', 'integer'), '''
+        SELECT u.id, u.first_name, u.last_name, u.email, u.username,
+               ui.skill, ui.experience, ui.education, ui.occupation, ui.location, ui.website,
+               ui.linkedin, ui.github, ui.twitter, ui.facebook, ui.instagram, ui.bio, ui.profile_image,
+               ui.user_id IS NOT NULL AS has_info,
+               u.posts_count, u.followers_count, u.following_count,
+               EXISTS(SELECT 1 FROM followers WHERE follower_id = $1 AND followed_id = u.id) AS is_following
+        FROM users u
+        LEFT JOIN user_info ui ON ui.user_id = u.id
+        WHERE u.id = $2
+    '''),
+}
+
+# Row types for the statements above; tuples with names, no per-row dict
+UserRow = namedtuple('UserRow', 'id email password first_name last_name username joined_date image_file')
+PostRow = namedtuple('PostRow', 'id title subtitle date body img_url author_id author reading_minutes')
+CommentRow = namedtuple('CommentRow', 'id text email user_id commenter_name profile_image')
+
+_PLACEHOLDER = re.compile(r'\$(\d+)')
+
+
+class StatementConnection(extensions.connection):
+    """psycopg2 connection that remembers which registry statements it has prepared."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+def _prepare_sql(name):
+    types, sql = STATEMENTS[name]
+    return f"PREPARE {name} ({', '.join(types)}) AS {sql}"
+
+
+def _execute_sql(name):
+    types, _ = STATEMENTS[name]
+    return f"EXECUTE {name} ({', '.join(['%s'] * len(types))})"
+
+
+def _plain_sql(name):
+    # Same statement with psycopg2 placeholders, for connections that can't keep prepared statements
+    return _PLACEHOLDER.sub(lambda m: f"%({m.group(1)})s", STATEMENTS[name][1])
+
+
+_EXECUTE = {name: _execute_sql(name) for name in STATEMENTS}
+_PLAIN = {name: _plain_sql(name) for name in STATEMENTS}
+
+
+def run(cursor, name, params=()):
+    """Execute registry statement `name` on the cursor, preparing it first on this connection if needed"""
+    prepared = getattr(cursor.connection, 'prepared', None)
+    if not STATEMENT_CONFIG['prepare'] or prepared is None:
+        cursor.execute(_PLAIN[name], {str(i): value for i, value in enumerate(params, 1)})
+        return cursor
+    if name not in prepared:
+        # Prepared statements belong to the session and survive rollbacks, so this runs once per connection
+        cursor.execute(_prepare_sql(name))
+        prepared.add(name)
+    cursor.execute(_EXECUTE[name], params)
+    return cursor
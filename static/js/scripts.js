@@ -13,6 +13,7 @@ class CleanBlogApp {
     this.setupPasswordToggles();
     this.setupFormValidation();
     this.setupFileUpload();
+    this.setupLoadMoreComments();
   }
 
   // Navbar scroll behavior
@@ -285,6 +286,32 @@ class CleanBlogApp {
     profilePreview.style.cursor = 'pointer';
     profilePreview.title = 'Click to choose a photo';
   }
+
+  // Append older comments fetched from the post's comments endpoint
+  setupLoadMoreComments() {
+    const button = document.getElementById('load-more-comments');
+    const list = document.getElementById('comment-list');
+    if (!button || !list) return;
+
+    button.addEventListener('click', async () => {
+      button.disabled = true;
+      try {
+        const response = await fetch(button.dataset.url, { headers: { Accept: 'application/json' } });
+        if (!response.ok) throw new Error(response.statusText);
+        const page = await response.json();
+        list.insertAdjacentHTML('beforeend', page.html);
+        if (page.next_url) {
+          button.dataset.url = page.next_url;
+          button.disabled = false;
+        } else {
+          button.remove();
+        }
+      } catch (error) {
+        button.disabled = false;
+        button.textContent = 'Could not load comments, try again';
+      }
+    });
+  }
 }
 
 // Initialize app
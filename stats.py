@@ -0,0 +1,198 @@
+import atexit
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from database import pool
+
+logger = logging.getLogger(__name__)
+
+STATS_CONFIG = {
+    'flush_interval': float(os.getenv("VIEW_FLUSH_INTERVAL", "10")),  # seconds between view count flushes
+    'half_life_hours': float(os.getenv("TRENDING_HALF_LIFE_HOURS", "24")),
+    'comment_weight': float(os.getenv("TRENDING_COMMENT_WEIGHT", "5")),  # one fresh comment = this many views
+    'window_days': int(os.getenv("TRENDING_WINDOW_DAYS", "7")),  # activity older than this is ignored
+    'trending_size': int(os.getenv("TRENDING_SIZE", "20")),
+    'refresh_interval': float(os.getenv("TRENDING_REFRESH_INTERVAL", "300")),
+    'in_process_worker': os.getenv("STATS_IN_PROCESS_WORKER", "true").lower() == "true",
+}
+
+TRENDING_LOCK_ID = 7_211_904
+
+
+def _decay_seconds():
+    # e-folding time of the exponential decay for the configured half-life
+    return STATS_CONFIG['half_life_hours'] * 3600 / math.log(2)
+
+
+class ViewCounter:
+    """Counts post views in memory and writes them to post_stats in one batched upsert per interval.
+
+    A background thread flushes every VIEW_FLUSH_INTERVAL seconds and refreshes the trending list
+    when it is due; `stop()` writes whatever is still pending, so a graceful shutdown loses nothing.
+    With STATS_IN_PROCESS_WORKER=false there is no thread: the request that records a view flushes
+    once the interval has passed, and `flask stats worker` keeps the trending list fresh.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._next_flush = time.monotonic() + config['flush_interval']
+
+        self.flushes = 0
+        self.flushed_views = 0
+        self.failures = 0
+
+    def record(self, post_id):
+        with self._lock:
+            self._pending[post_id] += 1
+        if self.config['in_process_worker']:
+            self.start()
+        elif time.monotonic() >= self._next_flush:
+            self._flush_inline()
+
+    def _flush_inline(self):
+        with self._lock:
+            if time.monotonic() < self._next_flush:
+                return  # another request got here first
+            self._next_flush = time.monotonic() + self.config['flush_interval']
+        try:
+            self.flush()
+        except psycopg2.Error:
+            logger.exception("could not flush post view counts")
+
+    def flush(self):
+        """Write pending views; returns how many were written. Failed batches are kept for the next flush"""
+        with self._lock:
+            batch, self._pending = self._pending, Counter()
+        if not batch:
+            return 0
+        try:
+            with pool.connection() as conn, conn.cursor() as cur:
+                # Rows are locked in post id order so concurrent flushes from other workers can't deadlock;
+                # views of posts deleted in the meantime are dropped by the join
+                execute_values(cur, f"""
+                    INSERT INTO post_stats (post_id, views, recent_views, updated_at)
+                    SELECT v.post_id, v.views, v.views, now()
+                    FROM (VALUES %s) AS v (post_id, views)
+                    JOIN blog_post bp ON bp.id = v.post_id
+                    ORDER BY v.post_id
+                    ON CONFLICT (post_id) DO UPDATE SET
+                        views = post_stats.views + EXCLUDED.views,
+                        recent_views = post_stats.recent_views
+                            * exp(-extract(epoch FROM now() - post_stats.updated_at) / {_decay_seconds():.1f})
+                            + EXCLUDED.views,
+                        updated_at = now()
+                """, sorted(batch.items()), page_size=len(batch))
+        except psycopg2.Error:
+            with self._lock:
+                self._pending.update(batch)
+                self.failures += 1
+            raise
+        with self._lock:
+            self.flushes += 1
+            self.flushed_views += sum(batch.values())
+        return sum(batch.values())
+
+    def run_forever(self):
+        next_refresh = time.monotonic()
+        while not self._stop.wait(self.config['flush_interval']):
+            try:
+                self.flush()
+            except psycopg2.Error:
+                logger.exception("could not flush post view counts")
+            if time.monotonic() >= next_refresh:
+                next_refresh = time.monotonic() + self.config['refresh_interval']
+                try:
+                    refresh_trending()
+                except psycopg2.Error:
+                    logger.exception("could not refresh trending posts")
+
+    def start(self):
+        """Start the background thread once per process"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self.run_forever, name="view-counter", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Stop the thread and write the remaining views"""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.config['flush_interval'])
+        try:
+            self.flush()
+        except psycopg2.Error:
+            logger.exception("could not flush post view counts on shutdown")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending_posts": len(self._pending),
+                "pending_views": sum(self._pending.values()),
+                "flushes": self.flushes,
+                "flushed_views": self.flushed_views,
+                "failures": self.failures,
+            }
+
+
+def refresh_trending(force=False):
+    """Recompute trending_posts if it is older than TRENDING_REFRESH_INTERVAL; returns rows written or None.
+
+    Every worker's counter thread calls this, so an advisory lock and the age check keep it to one
+    recomputation per interval across the deployment.
+    """
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (TRENDING_LOCK_ID,))
+        if not cur.fetchone()[0]:
+            return None
+        if not force:
+            cur.execute("""
+                SELECT COALESCE(max(computed_at) < now() - make_interval(secs => %s), TRUE) FROM trending_posts
+            """, (STATS_CONFIG['refresh_interval'],))
+            if not cur.fetchone()[0]:
+                return None
+
+        # Score = views decayed to now + comment_weight x comments, each comment decayed by its age
+        cur.execute("DELETE FROM trending_posts")
+        cur.execute("""
+            WITH views AS (
+                SELECT post_id, recent_views * exp(-extract(epoch FROM now() - updated_at) / %(decay)s) AS score
+                FROM post_stats
+                WHERE updated_at > now() - make_interval(days => %(window)s)
+            ), comments AS (
+                SELECT post_id, %(comment_weight)s * sum(exp(-extract(epoch FROM now() - created_at) / %(decay)s))
+                       AS score
+                FROM comment
+                WHERE created_at > now() - make_interval(days => %(window)s)
+                GROUP BY post_id
+            ), scored AS (
+                SELECT post_id, sum(score) AS score
+                FROM (SELECT * FROM views UNION ALL SELECT * FROM comments) activity
+                GROUP BY post_id
+                ORDER BY score DESC, post_id DESC
+                LIMIT %(size)s
+            )
+            INSERT INTO trending_posts (rank, post_id, score)
+            SELECT row_number() OVER (ORDER BY score DESC, post_id DESC), post_id, score FROM scored
+        """, {'decay': _decay_seconds(), 'window': STATS_CONFIG['window_days'],
+              'comment_weight': STATS_CONFIG['comment_weight'], 'size': STATS_CONFIG['trending_size']})
+        return cur.rowcount
+
+
+view_counter = ViewCounter(STATS_CONFIG)
+# Covers the development server; gunicorn workers stop it from worker_exit
+atexit.register(view_counter.stop)
@@ -0,0 +1,129 @@
+"""Shared fixtures. Tests that touch PostgreSQL are skipped unless TEST_DATABASE_URL points at a
+throwaway database; migrations are applied to it and the rows each test creates are deleted again.
+"""
+import os
+import uuid
+
+import pytest
+from psycopg2.extensions import parse_dsn
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+TEST_REPLICA_URL = os.getenv("TEST_REPLICA_URL")
+
+# Settings are read when the app is imported, so point it at the test database first
+if TEST_DATABASE_URL:
+    _dsn = parse_dsn(TEST_DATABASE_URL)
+    for key, name in (('dbname', 'DB_NAME'), ('user', 'DB_USER'), ('password', 'DB_PASSWORD'),
+                      ('host', 'DB_HOST'), ('port', 'DB_PORT')):
+        if key in _dsn:
+            os.environ[name] = _dsn[key]
+os.environ['DB_REPLICA_URLS'] = ""  # replica tests build their own routers
+os.environ['MAIL_IN_PROCESS_WORKER'] = "false"
+os.environ['STATS_IN_PROCESS_WORKER'] = "false"
+os.environ.pop('CACHE_REDIS_URL', None)
+
+
+class LastRequest:
+    """Query count and pool of the last test-client request, read at teardown after a streamed body is done."""
+
+    def __init__(self, app):
+        self.queries = self.pool = None
+        app.teardown_request(self._record)
+
+    def _record(self, exception):
+        from flask import g
+
+        stats = g.get('query_stats')
+        self.queries = stats.count if stats is not None else None
+        self.pool = g.get('db_pool')
+
+
+@pytest.fixture(scope="session")
+def app():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    from database import upgrade
+    from main import app
+
+    upgrade(log=lambda message: None)
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    return app
+
+
+@pytest.fixture(scope="session")
+def last_request(app):
+    # Teardown hooks can't be added once the app has handled a request, so this is registered up front
+    return LastRequest(app)
+
+
+@pytest.fixture
+def client(app, last_request):
+    return app.test_client()
+
+
+@pytest.fixture
+def get(client):
+    """GET a path and read the whole body, so streamed pages finish and their teardown runs"""
+    def get(path):
+        response = client.get(path)
+        response.get_data()
+        response.close()
+        return response
+    return get
+
+
+@pytest.fixture
+def login(client):
+    def login(user_id):
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+    return login
+
+
+@pytest.fixture
+def make_users(app):
+    """Create users with unique emails; they are deleted, with their posts, comments and follows, afterwards"""
+    from database import pool
+    from stats import view_counter
+
+    created = []
+
+    def make_users(count):
+        tag = uuid.uuid4().hex[:12]
+        with pool.connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO users (email, password, first_name, last_name)
+                SELECT 'test-' || %s || '-' || n || '@example.com', 'unused', 'Test', 'User ' || n
+                FROM generate_series(1, %s) n
+                ORDER BY n
+                RETURNING id
+            """, (tag, count))
+            ids = [row[0] for row in cur.fetchall()]
+        created.extend(ids)
+        return ids
+
+    yield make_users
+    view_counter.flush()  # pending views reference the posts deleted below
+    if created:
+        with pool.connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM users WHERE id = ANY(%s)", (created,))
+
+
+@pytest.fixture
+def make_post(app):
+    """Import a post by `author_id` with one comment per commenter id; returns the post id"""
+    from database import pool
+    from transfer import import_posts
+
+    def make_post(author_id, commenter_ids=()):
+        title = f"test post {uuid.uuid4().hex}"
+        record = {"title": title, "body": "<p>Body</p>", "author_id": author_id,
+                  "comments": [{"author_id": user_id, "text": f"<p>Comment {n}</p>"}
+                               for n, user_id in enumerate(commenter_ids, 1)]}
+        with pool.connection() as conn:
+            import_posts(conn, [record])
+            with conn.cursor() as cur:
+                cur.execute("SELECT id FROM blog_post WHERE title = %s", (title,))
+                return cur.fetchone()[0]
+    return make_post
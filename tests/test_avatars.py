@@ -0,0 +1,11 @@
+import os
+
+
+def test_upload_originals_are_never_served(app, get):
+    path = os.path.join(app.static_folder, "profile_pics", f"{'a' * 24}.src")
+    with open(path, "wb") as f:
+        f.write(b"original bytes")
+    try:
+        assert get(f"/static/profile_pics/{'a' * 24}.src").status_code == 404
+    finally:
+        os.remove(path)
@@ -0,0 +1,84 @@
+import pytest
+
+
+class FakeSMTP:
+    sent = []
+
+    def __init__(self, host, port, timeout=None):
+        pass
+
+    def starttls(self):
+        pass
+
+    def login(self, username, password):
+        pass
+
+    def send_message(self, message, from_addr=None, to_addrs=None):
+        self.sent.append(message)
+
+    def quit(self):
+        pass
+
+
+@pytest.fixture
+def worker(app, monkeypatch):
+    from database import pool
+    from mailer import MAIL_CONFIG, MailWorker
+
+    monkeypatch.setattr("smtplib.SMTP", FakeSMTP)
+    FakeSMTP.sent = []
+    config = dict(MAIL_CONFIG, sender="site@example.com", username=None, password=None)
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute("UPDATE outbound_mail SET status = 'failed' WHERE status = 'pending'")
+    return MailWorker(config)
+
+
+def queue(reply_to):
+    from database import pool
+
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO outbound_mail (from_addr, to_addr, subject, body, reply_to)
+            VALUES ('site@example.com', 'owner@example.com', 'User Alert', 'Hello', %s)
+            RETURNING id
+        """, (reply_to,))
+        return cur.fetchone()[0]
+
+
+def mail_row(mail_id):
+    from database import pool
+
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT status, attempts, last_error FROM outbound_mail WHERE id = %s", (mail_id,))
+        return cur.fetchone()
+
+
+def test_visitor_address_goes_in_reply_to(worker):
+    mail_id = queue("visitor@example.com")
+    worker.process_batch()
+    message, = FakeSMTP.sent
+    assert (message["From"], message["Reply-To"]) == ("site@example.com", "visitor@example.com")
+    assert mail_row(mail_id)[0] == "sent"
+
+
+def test_unsendable_message_is_recorded_and_does_not_block_the_queue(worker):
+    bad = queue("visitor@example.com\r\nBcc: everyone@example.com")
+    good = queue("visitor@example.com")
+    assert worker.process_batch() == 2
+    status, attempts, last_error = mail_row(bad)
+    assert (status, attempts) == ("pending", 1) and last_error
+    assert mail_row(good)[0] == "sent"
+
+
+def test_contact_queues_only_well_formed_addresses(client, monkeypatch):
+    from database import pool
+    from mailer import MAIL_CONFIG
+
+    monkeypatch.setitem(MAIL_CONFIG, "sender", "site@example.com")
+    monkeypatch.setitem(MAIL_CONFIG, "recipient", "owner@example.com")
+    for email in ("a@example.com\r\nBcc: b@example.com", "Someone <a@example.com>", "a@example.com"):
+        client.post("/contact", data={"name": "x", "email": email, "message": "hi"})
+
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM outbound_mail WHERE body LIKE 'Name: x%' RETURNING from_addr, reply_to")
+        assert cur.fetchall() == [("site@example.com", "a@example.com")]
@@ -0,0 +1,14 @@
+def test_post_page_queries_do_not_grow_with_comments(get, login, last_request, make_users, make_post):
+    author, *commenters = make_users(51)
+    one = make_post(author, commenters[:1])
+    fifty = make_post(author, commenters)
+    login(author)
+    get(f"/post/{one}")  # loads the user into the cache and prepares the statements
+
+    counts = {}
+    for post_id in (one, fifty):
+        response = get(f"/post/{post_id}")
+        assert response.status_code == 200
+        counts[post_id] = last_request.queries
+
+    assert counts[one] == counts[fifty]
@@ -0,0 +1,95 @@
+"""ReplicaRouter against a second PostgreSQL instance named by TEST_REPLICA_URL: a streaming replica
+of TEST_DATABASE_URL, or any database with the same schema."""
+import os
+
+import pytest
+
+TEST_REPLICA_URL = os.getenv("TEST_REPLICA_URL")
+# Nothing listens on port 1, so connecting fails straight away
+DEAD_URL = "postgresql://postgres@127.0.0.1:1/postgres"
+
+pytestmark = pytest.mark.skipif(not TEST_REPLICA_URL, reason="TEST_REPLICA_URL is not set")
+
+
+@pytest.fixture
+def make_router(app):
+    from database import ReplicaRouter, pool
+
+    routers = []
+
+    def make_router(urls, retry_after=30.0):
+        router = ReplicaRouter(pool, urls, retry_after)
+        routers.append(router)
+        return router
+
+    yield make_router
+    for router in routers:
+        router.closeall()
+
+
+def read_from(router):
+    """The pool one read is served from; the connection is used once and handed straight back"""
+    read_pool, conn = router.read_connection()
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1")
+    conn.rollback()
+    read_pool.putconn(conn)
+    return read_pool
+
+
+def test_reads_rotate_across_replicas(make_router):
+    router = make_router([TEST_REPLICA_URL, TEST_REPLICA_URL])
+    first, second = router.replicas
+    assert [read_from(router) for _ in range(4)] == [first, second, first, second]
+
+
+def test_unreachable_replica_is_skipped_until_retry_after(make_router):
+    router = make_router([DEAD_URL, TEST_REPLICA_URL], retry_after=60)
+    live = router.replicas[1]
+    assert [read_from(router) for _ in range(3)] == [live, live, live]
+    assert router.failures == 1
+    assert router.stats()["replicas"][0]["down"]
+
+
+def test_reads_fall_back_to_primary_when_no_replica_is_up(make_router):
+    from database import pool
+
+    router = make_router([DEAD_URL])
+    assert read_from(router) is pool
+    assert router.fallbacks == 1
+
+
+def test_exhausted_replica_pool_falls_back_without_waiting(make_router):
+    from database import pool
+
+    router = make_router([TEST_REPLICA_URL])
+    replica = router.replicas[0]
+    replica.maxconn = 1
+    _, held = router.read_connection()
+    try:
+        assert read_from(router) is pool
+        assert router.busy == 1
+    finally:
+        replica.putconn(held)
+
+
+def test_session_reads_its_own_writes_from_primary(client, get, login, last_request, make_users, make_router,
+                                                   monkeypatch):
+    import main
+
+    router = make_router([TEST_REPLICA_URL])
+    monkeypatch.setattr(main, "router", router)
+    follower, followed = make_users(2)
+    login(follower)
+
+    response = client.post(f"/follow/{followed}", data={"next": "/feed"})
+    assert response.status_code == 302
+    assert last_request.pool is main.pool
+
+    get("/feed")
+    assert last_request.pool is main.pool  # pinned for DB_PRIMARY_STICKY_SECONDS after the write
+
+    with client.session_transaction() as session:
+        session['primary_until'] = 0
+    get("/feed")
+    assert last_request.pool is router.replicas[0]
@@ -0,0 +1,13 @@
+def test_views_are_flushed_inline_without_the_worker_thread(make_users, make_post):
+    from database import pool
+    from stats import STATS_CONFIG, ViewCounter
+
+    post_id = make_post(*make_users(1))
+    counter = ViewCounter(dict(STATS_CONFIG, in_process_worker=False, flush_interval=0))
+    counter.record(post_id)
+    counter.record(post_id)
+
+    assert counter.stats()["pending_views"] == 0
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT views FROM post_stats WHERE post_id = %s", (post_id,))
+        assert cur.fetchone() == (2,)
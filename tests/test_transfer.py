@@ -0,0 +1,21 @@
+import pytest
+
+
+@pytest.mark.parametrize("bad, message", [
+    ({"author_id": "seven"}, "record 2 ('bad'): author_id 'seven' is not a number"),
+    ({"date": "yesterday"}, "record 2 ('bad'): date 'yesterday' is not an ISO 8601 date"),
+    ({"comments": [{"text": "ok"}, {}]}, "record 2 ('bad'): comment 2 has no text"),
+    ({"author_id": 0x7fffffff}, "record 2 ('bad'): unknown author_id 2147483647"),
+])
+def test_bad_records_are_reported_with_their_position(make_users, bad, message):
+    from database import pool
+    from transfer import ImportRecordError, import_posts
+
+    author, = make_users(1)
+    records = [{"title": "good", "body": "Body", "author_id": author},
+               dict({"title": "bad", "body": "Body", "author_id": author}, **bad)]
+    with pool.connection() as conn:
+        with pytest.raises(ImportRecordError) as error:
+            import_posts(conn, records)
+        conn.rollback()
+    assert str(error.value) == message
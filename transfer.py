@@ -0,0 +1,235 @@
+import io
+import json
+import os
+import re
+import sys
+from datetime import datetime, timezone
+
+from psycopg2.extras import execute_values
+
+from content import render_body
+
+try:
+    import markdown
+except ImportError:  # only needed for .md imports
+    markdown = None
+
+IMPORT_BATCH_SIZE = 1000
+EXPORT_ITERSIZE = 2000
+
+_FRONT_MATTER = re.compile(r'\A---\s*\n(.*?)\n---\s*\n?(.*)\Z', re.S)
+
+
+class ImportRecordError(ValueError):
+    """A record in an import file can't be loaded."""
+
+
+def read_markdown(path):
+    """One post from a Markdown file with `key: value` front matter"""
+    if markdown is None:
+        raise ImportRecordError(f"{path}: importing Markdown needs the 'Markdown' package (pip install Markdown)")
+    with open(path, encoding='utf-8') as f:
+        match = _FRONT_MATTER.match(f.read())
+    if not match:
+        raise ImportRecordError(f"{path}: missing --- front matter ---")
+    front, body = match.groups()
+    record = {}
+    for line in front.splitlines():
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        key, sep, value = line.partition(':')
+        if not sep:
+            raise ImportRecordError(f"{path}: bad front matter line {line!r}")
+        record[key.strip()] = value.strip().strip('"\'')
+    record['body'] = markdown.markdown(body)
+    return record
+
+
+def read_records(paths):
+    """Yield post dicts from NDJSON files ('-' for stdin), Markdown files or directories of them"""
+    for path in paths:
+        if path == '-':
+            yield from _read_ndjson(sys.stdin, '<stdin>')
+        elif os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(('.md', '.markdown')):
+                    yield read_markdown(os.path.join(path, name))
+        elif path.endswith(('.md', '.markdown')):
+            yield read_markdown(path)
+        else:
+            with open(path, encoding='utf-8') as f:
+                yield from _read_ndjson(f, path)
+
+
+def _read_ndjson(lines, name):
+    for number, line in enumerate(lines, 1):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise ImportRecordError(f"{name}:{number}: {e}")
+
+
+def _copy_field(value):
+    """Escape one value for COPY's text format"""
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def _batches(records, size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _resolve_authors(cur, batch, default_author):
+    """Map every author_email in the batch (posts and comments) to users.id, and find which given author_ids exist"""
+    emails = {default_author} if default_author else set()
+    ids = set()
+    for record in batch:
+        for r in (record, *(record.get('comments') or ())):
+            emails.add(r.get('author_email'))
+            if r.get('author_id'):
+                ids.add(int(r['author_id']))
+    emails.discard(None)
+    authors = {}
+    if emails:
+        cur.execute("SELECT lower(email), id FROM users WHERE lower(email) = ANY(%s)", ([e.lower() for e in emails],))
+        authors = dict(cur.fetchall())
+    known_ids = set()
+    if ids:
+        cur.execute("SELECT id FROM users WHERE id = ANY(%s)", (sorted(ids),))
+        known_ids = {row[0] for row in cur.fetchall()}
+    return authors, known_ids
+
+
+def _check_record(record, where):
+    """Reject a record whose shape would otherwise fail later with a bare KeyError or ValueError"""
+    if not isinstance(record, dict):
+        raise ImportRecordError(f"{where}: expected an object, got {type(record).__name__}")
+    if not record.get('title') or not record.get('body'):
+        raise ImportRecordError(f"{where}: title and body are required")
+    if not isinstance(record['title'], str) or not isinstance(record['body'], str):
+        raise ImportRecordError(f"{where}: title and body must be strings")
+    comments = record.get('comments') or []
+    if not isinstance(comments, list):
+        raise ImportRecordError(f"{where}: comments must be a list")
+    for m, comment in enumerate(comments, 1):
+        if not isinstance(comment, dict) or not isinstance(comment.get('text'), str) or not comment['text']:
+            raise ImportRecordError(f"{where}: comment {m} has no text")
+    for r, label in ((record, where), *((c, f"{where} comment {m}") for m, c in enumerate(comments, 1))):
+        if r.get('author_id'):
+            try:
+                int(r['author_id'])
+            except (TypeError, ValueError):
+                raise ImportRecordError(f"{label}: author_id {r['author_id']!r} is not a number")
+
+
+def _author_id(record, authors, known_ids, default_author, where):
+    if record.get('author_id'):
+        author_id = int(record['author_id'])
+        if author_id not in known_ids:
+            raise ImportRecordError(f"{where}: unknown author_id {author_id}")
+        return author_id
+    email = (record.get('author_email') or default_author or '').lower()
+    if email not in authors:
+        raise ImportRecordError(f"{where}: unknown author {email or '(none)'}; "
+                                "create the user or pass --default-author")
+    return authors[email]
+
+
+def _parse_date(value, where):
+    if not value:
+        return datetime.now(timezone.utc)
+    parsed = value
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            parsed = None
+    if not isinstance(parsed, datetime):
+        raise ImportRecordError(f"{where}: date {value!r} is not an ISO 8601 date")
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def import_posts(conn, records, default_author=None, batch_size=IMPORT_BATCH_SIZE, log=None):
+    """Insert posts (and their comments) in batches, one transaction per batch; returns (posts, comments)"""
+    posts_total = comments_total = 0
+    for batch in _batches(records, batch_size):
+        places = []
+        for n, record in enumerate(batch, posts_total + 1):
+            places.append(f"record {n} ({record.get('title', 'untitled')!r})" if isinstance(record, dict)
+                          else f"record {n}")
+            _check_record(record, places[-1])
+        with conn.cursor() as cur:
+            authors, known_ids = _resolve_authors(cur, batch, default_author)
+            post_rows = []
+            for where, record in zip(places, batch):
+                rendered = render_body(record['body'])
+                post_rows.append((
+                    record['title'], record.get('subtitle', ''), _parse_date(record.get('date'), where), record['body'],
+                    rendered['html'], rendered['excerpt'], rendered['word_count'], rendered['reading_minutes'],
+                    record.get('author', ''), record.get('img_url', ''),
+                    _author_id(record, authors, known_ids, default_author, where),
+                ))
+            post_ids = [row[0] for row in execute_values(cur, """
+                INSERT INTO blog_post (title, subtitle, date, body, body_html, excerpt, word_count, reading_minutes,
+                                       author, img_url, author_id)
+                VALUES %s RETURNING id
+            """, post_rows, page_size=batch_size, fetch=True)]
+
+            # Comment ids aren't needed back, so they go through COPY
+            comment_rows = io.StringIO()
+            comment_count = 0
+            for post_id, where, record in zip(post_ids, places, batch):
+                for m, comment in enumerate(record.get('comments') or (), 1):
+                    rendered = render_body(comment['text'])
+                    comment_rows.write("\t".join(_copy_field(v) for v in (
+                        comment['text'], rendered['html'], rendered['excerpt'], rendered['word_count'],
+                        rendered['reading_minutes'],
+                        _author_id(comment, authors, known_ids, default_author, f"{where} comment {m}"), post_id,
+                    )) + "\n")
+                    comment_count += 1
+            if comment_count:
+                comment_rows.seek(0)
+                cur.copy_expert("""
+                    COPY comment (text, text_html, excerpt, word_count, reading_minutes, author_id, post_id)
+                    FROM STDIN
+                """, comment_rows)
+        conn.commit()
+        posts_total += len(post_ids)
+        comments_total += comment_count
+        if log:
+            log(f"  {posts_total} post(s), {comments_total} comment(s)")
+    return posts_total, comments_total
+
+
+def export_posts(conn, out, itersize=EXPORT_ITERSIZE):
+    """Write every post with its comments as NDJSON, streaming through a server-side cursor; returns posts written"""
+    written = 0
+    # A named cursor keeps the result set on the server and fetches `itersize` rows per round trip
+    with conn.cursor(name="posts_export") as cur:
+        cur.itersize = itersize
+        cur.execute("""
+            SELECT bp.id, bp.title, bp.subtitle, bp.date, bp.author, u.email, bp.img_url, bp.body,
+                   COALESCE((
+                       SELECT json_agg(json_build_object('author_email', cu.email, 'text', c.text) ORDER BY c.id)
+                       FROM comment c JOIN users cu ON cu.id = c.author_id
+                       WHERE c.post_id = bp.id
+                   ), '[]'::json) AS comments
+            FROM blog_post bp
+            JOIN users u ON u.id = bp.author_id
+            ORDER BY bp.id
+        """)
+        for row in cur:
+            out.write(json.dumps({
+                "id": row[0], "title": row[1], "subtitle": row[2], "date": row[3].isoformat(), "author": row[4],
+                "author_email": row[5], "img_url": row[6], "body": row[7], "comments": row[8],
+            }, ensure_ascii=False) + "\n")
+            written += 1
+    return written